@@ -1,36 +1,354 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+import time
+
+# Measured from before the framework imports; reported once the worker is ready
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, WebSocket
+from fastapi.responses import JSONResponse, ORJSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne, WriteConcern, monitoring
+import bson
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure, PyMongoError
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing import Dict, List, Literal, Optional, Union
 import uuid
-from datetime import datetime, timezone
-from emergentintegrations.llm.chat import LlmChat, UserMessage
+import base64
+import importlib.util
+import bisect
+import contextlib
+import contextvars
+import csv
+import re
+import hashlib
+import copy
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta, timezone
 import json
+import asyncio
+import random
+import sys
+import threading
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+# ---------- Lazy Imports ----------
+# httpx (the Gemini client) and numpy (portfolio analytics) are bound here but only
+# executed on first attribute access, so workers serving list/detail reads never load
+# them. Annotations that name their types are strings for the same reason.
+LAZY_MODULES = ("httpx", "numpy")
+
+_lazy_pending = set()  # names bound by lazy_import whose module code has not run yet
+
+class _ExecutionRecorder:
+    """Wraps a module's loader so the first real execution clears its pending flag."""
+
+    def __init__(self, name: str, loader):
+        self.name = name
+        self.loader = loader
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        self.loader.exec_module(module)
+        _lazy_pending.discard(self.name)
+
+def lazy_import(name: str):
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}")
+    loader = importlib.util.LazyLoader(_ExecutionRecorder(name, spec.loader))
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    _lazy_pending.add(name)
+    loader.exec_module(module)
+    return module
+
+def module_loaded(name: str) -> bool:
+    """False while `name` is missing or still a lazy placeholder."""
+    return name in sys.modules and name not in _lazy_pending
+
+httpx = lazy_import("httpx")
+np = lazy_import("numpy")
+
+def resident_memory_bytes() -> int:
+    """Current RSS from /proc, or the peak RSS where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+# ---------- Metrics ----------
+# In-process Prometheus-style metrics, served as text from /api/metrics. Each HTTP request
+# also carries a RequestTrace (a context variable) that Mongo commands, LLM calls and
+# explicit `span`s add their time to; with SLOW_REQUEST_MS set, requests over it are logged
+# with that per-phase breakdown. Phases can overlap (a span may contain Mongo time).
+SLOW_REQUEST_MS = float(os.environ.get('SLOW_REQUEST_MS', '0'))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self._values = {}
+        # Mongo command events arrive on Motor's executor threads
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *label_values):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for values, total in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, values)} {total}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                # Per-bucket counts (made cumulative on render), then sum and count
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for values, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), series):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{format_labels(self.labels + ('le',), values + (le,))} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labels, values)} {series[-2]:.6f}")
+                lines.append(f"{self.name}_count{format_labels(self.labels, values)} {series[-1]}")
+        return lines
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._gauges = []
+
+    def counter(self, *args, **kwargs) -> Counter:
+        self._metrics.append(Counter(*args, **kwargs))
+        return self._metrics[-1]
+
+    def histogram(self, *args, **kwargs) -> Histogram:
+        self._metrics.append(Histogram(*args, **kwargs))
+        return self._metrics[-1]
+
+    def gauge(self, name: str, help: str, read):
+        """A value read at scrape time from `read()`."""
+        self._gauges.append((name, help, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for name, help, read in self._gauges:
+            lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {read()}"]
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+HTTP_REQUEST_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route", "status"))
+MONGO_COMMAND_SECONDS = metrics.histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("command", "collection", "outcome"))
+LLM_REQUEST_SECONDS = metrics.histogram(
+    "llm_request_duration_seconds", "LLM gateway call latency, including retries", ("operation", "outcome"))
+LLM_FIRST_TOKEN_SECONDS = metrics.histogram(
+    "llm_first_token_seconds", "Time to the first streamed LLM chunk")
+LLM_QUEUE_SECONDS = metrics.histogram(
+    "llm_queue_wait_seconds", "Time waiting for an LLM gateway concurrency slot")
+LLM_TOKENS = metrics.counter("llm_tokens_total", "Tokens sent to and received from the LLM", ("kind",))
+SPAN_SECONDS = metrics.histogram("span_duration_seconds", "Duration of named hot-path phases", ("span",))
+CHAT_REJECTED = metrics.counter("chat_rejected_total", "Chat requests turned away with 429", ("reason",))
+CHAT_COALESCED = metrics.counter(
+    "chat_coalesced_total", "Chat requests that joined an identical in-flight turn", ("kind",))
+
+class RequestTrace:
+    """Time spent per phase within one request; `mongo` is appended to from executor threads."""
+
+    def __init__(self):
+        self.phases = {}
+        self.mongo = []
+        self.tokens = {"prompt": 0, "completion": 0}
+
+    def add(self, phase: str, seconds: float):
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    def breakdown(self) -> dict:
+        mongo = {}
+        for name, seconds in list(self.mongo):
+            total, calls = mongo.get(name, (0.0, 0))
+            mongo[name] = (total + seconds, calls + 1)
+        return {
+            "phases_ms": {k: round(v * 1000, 1) for k, v in self.phases.items()},
+            "mongo_ms": round(sum(t for t, _ in mongo.values()) * 1000, 1),
+            "mongo": {k: f"{t * 1000:.1f} ms x{c}" for k, (t, c) in sorted(mongo.items(), key=lambda i: -i[1][0])},
+            "tokens": self.tokens,
+        }
+
+_request_trace = contextvars.ContextVar("request_trace", default=None)
+
+@contextlib.contextmanager
+def span(name: str):
+    """Time a block as a named phase of the current request (and in span_duration_seconds)."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        SPAN_SECONDS.observe(elapsed, name)
+        trace = _request_trace.get()
+        if trace is not None:
+            trace.add(name, elapsed)
+
+class MetricsMiddleware:
+    """Records per-route latency and, over SLOW_REQUEST_MS, logs the request's phase breakdown."""
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = RequestTrace()
+        token = _request_trace.set(trace)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_trace.reset(token)
+            route = self._route(scope)
+            HTTP_REQUEST_SECONDS.observe(elapsed, scope["method"], route, str(status))
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                logger.warning(
+                    f"Slow request {scope['method']} {route} ({status}, {elapsed * 1000:.1f} ms): "
+                    f"{json.dumps(trace.breakdown())}"
+                )
+
+    def _route(self, scope) -> str:
+        # Label by route template, never the raw path, to keep label cardinality bounded
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        if self._route_paths is None:
+            self._route_paths = {getattr(r, "endpoint", None): r.path for r in scope["app"].routes}
+        return self._route_paths.get(endpoint, "unmatched")
+
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', '100'))
+
+class SlowQueryLogger(monitoring.CommandListener):
+    """Times every Mongo command into metrics and the current request's trace, and logs
+    any command slower than SLOW_QUERY_MS with the command that caused it."""
+
+    def __init__(self):
+        self._commands = {}
+
+    def started(self, event):
+        self._commands[event.request_id] = event.command
+
+    def succeeded(self, event):
+        self._report(event, "ok")
+
+    def failed(self, event):
+        self._report(event, "failed")
+
+    def _report(self, event, outcome):
+        command = self._commands.pop(event.request_id, None)
+        duration_ms = event.duration_micros / 1000
+        collection = command.get(event.command_name) if command is not None else None
+        if not isinstance(collection, str):
+            collection = (command or {}).get("collection", "")
+        MONGO_COMMAND_SECONDS.observe(duration_ms / 1000, event.command_name, collection, outcome)
+        # Motor copies the caller's context onto its executor thread, so this is the request's trace
+        trace = _request_trace.get()
+        if trace is not None:
+            trace.mongo.append((f"{event.command_name} {collection}".strip(), duration_ms / 1000))
+        if duration_ms >= SLOW_QUERY_MS and command is not None:
+            logger.warning(
+                f"Slow query ({outcome}, {duration_ms:.1f} ms) {event.command_name}: {str(command)[:500]}"
+            )
+
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[SlowQueryLogger()])
 db = client[os.environ['DB_NAME']]
 
 GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
 
-app = FastAPI()
-api_router = APIRouter(prefix="/api")
+# Opt-in orjson encoding for JSON responses (needs the `orjson` package)
+JSON_RESPONSE = os.environ.get('JSON_RESPONSE', 'stdlib')
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-logger = logging.getLogger(__name__)
+def json_response_class():
+    if JSON_RESPONSE == 'orjson':
+        try:
+            import orjson  # noqa: F401
+            return ORJSONResponse
+        except ImportError:
+            logger.warning("JSON_RESPONSE=orjson but orjson is not installed; using the stdlib encoder")
+    return JSONResponse
+
+JSON_RESPONSE_CLASS = json_response_class()
+
+app = FastAPI(default_response_class=JSON_RESPONSE_CLASS)
+api_router = APIRouter(prefix="/api")
 
 # ---------- Pydantic Models ----------
 class ReviewStatusUpdate(BaseModel):
     review_status: str
 
+class BulkReviewStatusItem(BaseModel):
+    id: str
+    review_status: str
+    # Optimistic concurrency: reject the item if the application has moved on
+    expected_version: Optional[int] = None
+
+class BulkReviewStatusUpdate(BaseModel):
+    updates: List[BulkReviewStatusItem] = Field(..., min_length=1, max_length=1000)
+
 class ChatRequest(BaseModel):
     session_id: str
     message: str
@@ -39,6 +357,111 @@ class ChatRequest(BaseModel):
 class ChatResponse(BaseModel):
     response: str
     message_id: str
+    prompt_tokens: Optional[int] = None
+
+ANALYSIS_SECTIONS = ("ai_recommendation", "insights_synthesis", "financial_analysis", "macro_analysis")
+
+class AnalysisJobRequest(BaseModel):
+    sections: List[Literal["ai_recommendation", "insights_synthesis", "financial_analysis", "macro_analysis"]] = list(ANALYSIS_SECTIONS)
+    priority: int = 0
+    idempotency_key: Optional[str] = None
+
+# ---------- Response Models ----------
+# Typed shapes of the LoanApplication schema (spec.md), used for the OpenAPI schema and to
+# validate content on the way *in* (analysis sections, imports). Application reads are
+# served from already-validated documents, so those routes encode the stored dicts
+# directly with `json_response` rather than re-validating and walking every document
+# through jsonable_encoder. Detail fields are optional so the model also covers summaries.
+Number = Union[int, float]
+
+class AiRecommendation(BaseModel):
+    action: str
+    notes: str
+
+class RatioPoint(BaseModel):
+    year: str
+    value: Number
+
+class KeyRatios(BaseModel):
+    debt_to_equity: List[RatioPoint]
+    interest_coverage: List[RatioPoint]
+
+class CovenantRecommendation(BaseModel):
+    metric: str
+    value: str
+
+class ApplicationDocument(BaseModel):
+    name: str
+    status: str
+
+class FinancialYear(BaseModel):
+    year: str
+    amount: Number
+    operating_margin: Number
+
+class FinancialAnalysis(BaseModel):
+    summary: str
+    financials: List[FinancialYear]
+
+class PortersForce(BaseModel):
+    score: int = Field(..., ge=1, le=5)
+    description: str
+
+class PortersForces(BaseModel):
+    buyer_power: PortersForce
+    supplier_power: PortersForce
+    threat_new_entrants: PortersForce
+    threat_substitutes: PortersForce
+    competitive_rivalry: PortersForce
+
+class MacroAnalysis(BaseModel):
+    summary: str
+    porters_forces: PortersForces
+
+class LoanApplication(BaseModel):
+    id: str
+    application_no: str
+    applicant_name: str
+    industry: str
+    loan_amount: Number
+    loan_amount_display: str
+    legal_entity_type: str
+    application_stage: str
+    documents_status: str
+    application_status: str
+    review_status: str
+    is_overdue: bool
+    version: Optional[int] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    ai_recommendation: Optional[AiRecommendation] = None
+    company_insights: Optional[List[str]] = None
+    key_ratios: Optional[KeyRatios] = None
+    covenant_recommendations: Optional[List[CovenantRecommendation]] = None
+    documents: Optional[List[ApplicationDocument]] = None
+    application_summary: Optional[str] = None
+    insights_synthesis: Optional[str] = None
+    financial_analysis: Optional[FinancialAnalysis] = None
+    macro_analysis: Optional[MacroAnalysis] = None
+
+class LoanApplicationImport(LoanApplication):
+    # Accepted so exported rows re-import cleanly, but never stored: ids are assigned by the
+    # server on insert, and existing applications keep theirs
+    id: Optional[str] = None
+
+class StatsBucket(BaseModel):
+    count: int
+    overdue: int
+
+class ApplicationsPage(BaseModel):
+    applications: List[LoanApplication]
+    stats: Dict[str, StatsBucket]
+    next_cursor: Optional[str] = None
+    has_more: bool = False
+
+def json_response(content, headers: Optional[dict] = None) -> Response:
+    """Encode a payload of plain JSON types without FastAPI's validation/encoder pass."""
+    return JSON_RESPONSE_CLASS(content, headers=headers)
 
 # ---------- Seed Data ----------
 def get_seed_applications():
@@ -455,6 +878,2417 @@ def get_seed_applications():
     ]
 
 
+# ---------- Stats ----------
+# Workbench status cards: bucket name -> review statuses counted in it
+STATS_BUCKETS = {
+    "pending": ["Review Pending"],
+    "awaiting": ["Awaiting Instructions"],
+    "completed": ["Approved", "Rejected"],
+}
+
+def status_bucket(review_status: Optional[str]) -> Optional[str]:
+    return next((b for b, statuses in STATS_BUCKETS.items() if review_status in statuses), None)
+
+def stats_delta(old_status: Optional[str], new_status: Optional[str], is_overdue: bool) -> dict:
+    """Change to each stats bucket when one application moves from old_status to new_status."""
+    delta = {}
+    for bucket, sign in ((status_bucket(old_status), -1), (status_bucket(new_status), 1)):
+        if bucket is None:
+            continue
+        entry = delta.setdefault(bucket, {"count": 0, "overdue": 0})
+        entry["count"] += sign
+        entry["overdue"] += sign if is_overdue else 0
+    return {b: d for b, d in delta.items() if d["count"] or d["overdue"]}
+
+async def compute_stats():
+    """Workbench status cards from the review_status rollups (a handful of documents)."""
+    rows = await db.rollups.find(
+        {"dimension": "review_status"}, {"_id": 0, "value": 1, "count": 1, "overdue": 1}
+    ).to_list(None)
+    stats = {bucket: {"count": 0, "overdue": 0} for bucket in STATS_BUCKETS}
+    for row in rows:
+        bucket = status_bucket(row["value"])
+        if bucket:
+            stats[bucket]["count"] += row["count"]
+            stats[bucket]["overdue"] += row["overdue"]
+    return stats
+
+# ---------- Rollups ----------
+# Materialized counters per dimension value: {count, overdue, loan_amount}. Every write
+# that inserts applications or changes a rolled-up field applies the difference with $inc
+# (rollup_deltas/apply_rollup_deltas), so dashboards read a few small documents instead of
+# scanning applications. The reconciler compares them against a full scan and repairs
+# drift, e.g. from a process dying between an application write and its rollup update.
+ROLLUP_DIMENSIONS = ("industry", "legal_entity_type", "review_status")
+ROLLUP_RECONCILE_SECONDS = float(os.environ.get('ROLLUP_RECONCILE_SECONDS', '3600'))
+ROLLUP_RECONCILE_SETTLE_SECONDS = 1.0
+ROLLUP_FIELDS = ("count", "overdue", "loan_amount")
+ROLLUP_PROJECTION = {"_id": 0, "industry": 1, "legal_entity_type": 1, "review_status": 1, "is_overdue": 1, "loan_amount": 1}
+
+def rollup_key(dimension: str, value) -> str:
+    return f"{dimension}:{json.dumps(value)}"
+
+def rollup_loan_amount(doc: dict):
+    amount = doc.get("loan_amount")
+    return amount if isinstance(amount, (int, float)) and not isinstance(amount, bool) else 0
+
+def rollup_deltas(old: Optional[dict], new: Optional[dict], deltas: Optional[dict] = None) -> dict:
+    """Accumulate the rollup changes for one application going from old to new.
+
+    Pass old=None for an insert and new=None for a delete; pass `deltas` to sum a batch.
+    """
+    deltas = {} if deltas is None else deltas
+    for doc, sign in ((old, -1), (new, 1)):
+        if doc is None:
+            continue
+        for dimension in ROLLUP_DIMENSIONS:
+            entry = deltas.setdefault(rollup_key(dimension, doc.get(dimension)), {
+                "dimension": dimension, "value": doc.get(dimension), "count": 0, "overdue": 0, "loan_amount": 0,
+            })
+            entry["count"] += sign
+            entry["overdue"] += sign if doc.get("is_overdue") else 0
+            entry["loan_amount"] += sign * rollup_loan_amount(doc)
+    return deltas
+
+async def apply_rollup_deltas(deltas: dict):
+    ops = [
+        UpdateOne(
+            {"_id": key},
+            {"$inc": {f: d[f] for f in ROLLUP_FIELDS}, "$setOnInsert": {"dimension": d["dimension"], "value": d["value"]}},
+            upsert=True,
+        )
+        for key, d in deltas.items() if any(d[f] for f in ROLLUP_FIELDS)
+    ]
+    if ops:
+        await db.rollups.bulk_write(ops, ordered=False)
+
+async def scan_rollups() -> dict:
+    """Rollups recomputed from every application document (one $facet aggregation)."""
+    group = {
+        "count": {"$sum": 1},
+        "overdue": {"$sum": {"$cond": ["$is_overdue", 1, 0]}},
+        "loan_amount": {"$sum": "$loan_amount"},
+    }
+    pipeline = [
+        {"$project": ROLLUP_PROJECTION},
+        {"$facet": {dimension: [{"$group": {"_id": f"${dimension}", **group}}] for dimension in ROLLUP_DIMENSIONS}},
+    ]
+    facets = (await db.applications.aggregate(pipeline).to_list(1))[0]
+    return {
+        rollup_key(dimension, row["_id"]): {
+            "dimension": dimension, "value": row["_id"],
+            "count": row["count"], "overdue": row["overdue"], "loan_amount": row["loan_amount"],
+        }
+        for dimension in ROLLUP_DIMENSIONS for row in facets[dimension]
+    }
+
+async def rebuild_rollups():
+    """Replace all rollups with a full scan; for bulk loads (seeding) and first start.
+
+    Upserts per key rather than delete-then-insert, so workers starting together, or a
+    status change landing mid-rebuild, cannot collide on duplicate _ids.
+    """
+    scanned = await scan_rollups()
+    if scanned:
+        await db.rollups.bulk_write(
+            [ReplaceOne({"_id": key}, rollup, upsert=True) for key, rollup in scanned.items()], ordered=False
+        )
+    await db.rollups.delete_many({"_id": {"$nin": list(scanned)}})
+    await bump_rollup_generation()
+
+async def rollup_drift() -> dict:
+    """key -> (scanned - stored) for every rollup that disagrees with a full scan."""
+    # Stored first: a write landing mid-check shows up as drift, never hides real drift
+    stored = {r["_id"]: r async for r in db.rollups.find({})}
+    scanned = await scan_rollups()
+    drift = {}
+    for key in set(stored) | set(scanned):
+        have, want = stored.get(key, {}), scanned.get(key, {})
+        diff = {f: want.get(f, 0) - have.get(f, 0) for f in ROLLUP_FIELDS}
+        if abs(diff["loan_amount"]) < 0.01:
+            # Float sums in a different order; not drift
+            diff["loan_amount"] = 0
+        if any(diff.values()):
+            source = want or have
+            drift[key] = {"dimension": source["dimension"], "value": source["value"], **diff}
+    return drift
+
+async def reconcile_rollups(repair: bool) -> dict:
+    """Verify rollups against a full scan and optionally repair them.
+
+    A repair only applies drift seen identically by two checks ROLLUP_RECONCILE_SETTLE_SECONDS
+    apart (so writes in flight aren't "fixed"), as an $inc of the difference, under a lease
+    so concurrent reconcilers never apply the same correction twice.
+    """
+    start = time.perf_counter()
+    drift = await rollup_drift()
+    report = {"checked_at": datetime.now(timezone.utc).isoformat(), "drift": list(drift.values()), "repaired": 0}
+    if drift and repair:
+        now = datetime.now(timezone.utc)
+        try:
+            await db.meta.find_one_and_update(
+                {"_id": "rollup_reconcile", "lease_expires_at": {"$not": {"$gt": now}}},
+                {"$set": {"lease_expires_at": now + timedelta(minutes=5)}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            report["skipped"] = "another reconcile holds the lease"
+            return report
+        try:
+            await asyncio.sleep(ROLLUP_RECONCILE_SETTLE_SECONDS)
+            confirmed = {k: d for k, d in (await rollup_drift()).items() if drift.get(k) == d}
+            await apply_rollup_deltas(confirmed)
+            if confirmed:
+                await bump_rollup_generation()  # stats changed with no application write
+            report["repaired"] = len(confirmed)
+        finally:
+            await db.meta.update_one({"_id": "rollup_reconcile"}, {"$set": {"lease_expires_at": None}})
+    report["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    if drift:
+        logger.warning(f"Rollup drift on {len(drift)} keys, repaired {report['repaired']}: {list(drift)[:10]}")
+    return report
+
+async def rollup_reconciler():
+    while True:
+        await asyncio.sleep(ROLLUP_RECONCILE_SECONDS)
+        try:
+            await reconcile_rollups(repair=True)
+        except Exception as e:
+            logger.error(f"Rollup reconcile failed: {e}")
+
+# ---------- Search ----------
+SEARCH_PREFIX_FIELDS = ("applicant_name", "application_no", "industry")
+MAX_SEARCH_TOKEN_LENGTH = 20
+MAX_SEARCH_TOKENS = 8
+# Shorter prefixes match much of the collection and leave Mongo sorting it in memory; a
+# prefix search ignores them (and with nothing left, lists unfiltered)
+MIN_SEARCH_PREFIX_LENGTH = 3
+
+# Internal fields that never leave the API
+APPLICATION_PROJECTION = {"_id": 0, "search_terms": 0, "chat_context": 0}
+
+# Relevance-ranked search over the identifying fields plus the AI insight text
+SEARCH_TEXT_INDEX = [
+    ("applicant_name", "text"), ("application_no", "text"), ("industry", "text"),
+    ("company_insights", "text"), ("insights_synthesis", "text"), ("application_summary", "text"),
+]
+SEARCH_TEXT_WEIGHTS = {"applicant_name": 10, "application_no": 10, "industry": 5}
+
+def search_tokens(text: str) -> List[str]:
+    """Lowercased alphanumeric tokens of a search string. Everything else is dropped,
+    so user input is never interpreted as a pattern."""
+    tokens = re.findall(r"[a-z0-9]+", text.lower())[:MAX_SEARCH_TOKENS]
+    return [t[:MAX_SEARCH_TOKEN_LENGTH] for t in tokens]
+
+def prefix_search_query(tokens: List[str]) -> dict:
+    """Every token of searchable length must be a stored prefix; {} when none is."""
+    prefixes = [t for t in tokens if len(t) >= MIN_SEARCH_PREFIX_LENGTH]
+    return {"search_terms": {"$all": prefixes}} if prefixes else {}
+
+def build_search_terms(app: dict) -> List[str]:
+    """Edge n-grams of every token in the prefix-searchable fields.
+
+    Stored on the document as `search_terms` under a multikey index, so typeahead
+    is an index point lookup instead of an unanchored regex scan.
+    """
+    terms = set()
+    for field in SEARCH_PREFIX_FIELDS:
+        for token in search_tokens(str(app.get(field) or "")):
+            terms.update(token[:i] for i in range(MIN_SEARCH_PREFIX_LENGTH, len(token) + 1))
+    return sorted(terms)
+
+async def backfill_derived_fields():
+    """Populate `search_terms` and `chat_context` on documents written before they existed."""
+    ops = []
+    cursor = db.applications.find(
+        {"$or": [{"search_terms": {"$exists": False}}, {"chat_context": {"$exists": False}}]}
+    )
+    async for a in cursor:
+        ops.append(UpdateOne({"_id": a["_id"]}, {"$set": derived_fields(a)}))
+        if len(ops) >= 1000:
+            await db.applications.bulk_write(ops, ordered=False)
+            ops = []
+    if ops:
+        await db.applications.bulk_write(ops, ordered=False)
+
+# ---------- Pagination ----------
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+# Columns rendered by the Workbench table; the full document is loaded on row expansion
+SUMMARY_PROJECTION = {
+    "_id": 0, "id": 1, "application_no": 1, "applicant_name": 1, "industry": 1,
+    "loan_amount": 1, "loan_amount_display": 1, "legal_entity_type": 1, "application_stage": 1,
+    "documents_status": 1, "application_status": 1, "review_status": 1, "is_overdue": 1,
+    "updated_at": 1, "version": 1,
+}
+
+def encode_cursor(value, app_id: str) -> str:
+    """Opaque keyset cursor: the sort key and id of the last row on the page."""
+    return base64.urlsafe_b64encode(json.dumps([value, app_id]).encode()).decode()
+
+# None: the sort field is missing or null on the last row (legacy documents)
+CURSOR_VALUE_TYPES = (str, int, float, datetime, type(None))
+
+def decode_cursor(cursor: str):
+    """Inverse of encode_cursor. Both parts go into query filters, so only scalars are
+    accepted: a crafted cursor carrying an object would smuggle in query operators."""
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(decoded, list) or len(decoded) != 2:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    value, app_id = decoded
+    if not isinstance(value, CURSOR_VALUE_TYPES) or isinstance(value, bool) or not isinstance(app_id, str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return value, app_id
+
+def keyset_after(field: str, value, app_id: str, direction: int) -> dict:
+    """Filter for rows after (value, app_id) in a sort on (field, id).
+
+    Missing and null values sort before every other value, so they come first ascending
+    and last descending; range operators never match null, so those rows are added or
+    matched explicitly.
+    """
+    op = "$gt" if direction == 1 else "$lt"
+    if value is None:
+        same = {field: None, "id": {op: app_id}}
+        return {"$or": [same, {field: {"$ne": None}}]} if direction == 1 else same
+    after = [{field: {op: value}}, {field: value, "id": {op: app_id}}]
+    if direction == -1:
+        after.append({field: None})
+    return {"$or": after}
+
+# ---------- LLM Gateway ----------
+# One gateway per process: pooled keep-alive connections to the provider, a bound on
+# concurrent generations, per-call timeouts, jittered retries on 429/5xx and a circuit
+# breaker that fails fast while the provider is down. LLM_PROVIDER=fake swaps in a
+# deterministic offline provider.
+LLM_PROVIDER = os.environ.get('LLM_PROVIDER', 'gemini')  # gemini | fake
+LLM_MODEL = os.environ.get('LLM_MODEL', 'gemini-2.0-flash')
+LLM_MAX_CONCURRENCY = int(os.environ.get('LLM_MAX_CONCURRENCY', '16'))
+LLM_TIMEOUT_SECONDS = float(os.environ.get('LLM_TIMEOUT_SECONDS', '60'))
+LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', '2'))
+LLM_BREAKER_THRESHOLD = int(os.environ.get('LLM_BREAKER_THRESHOLD', '5'))
+LLM_BREAKER_RESET_SECONDS = float(os.environ.get('LLM_BREAKER_RESET_SECONDS', '30'))
+FAKE_LLM_LATENCY_MS = float(os.environ.get('FAKE_LLM_LATENCY_MS', '200'))
+
+GEMINI_API_BASE = "https://generativelanguage.googleapis.com/v1beta"
+
+class LlmError(Exception):
+    status_code = 502
+    retryable = False
+
+class LlmProviderError(LlmError):
+    def __init__(self, message: str, retryable: bool = False):
+        super().__init__(message)
+        self.retryable = retryable
+
+class LlmTimeoutError(LlmError):
+    status_code = 504
+    retryable = True
+
+class LlmUnavailableError(LlmError):
+    """Raised without calling the provider while the circuit breaker is open."""
+    status_code = 503
+
+class GeminiProvider:
+    def __init__(self, api_key: str, model: str, max_connections: int):
+        self.model = model
+        self.client = httpx.AsyncClient(
+            base_url=GEMINI_API_BASE,
+            headers={"x-goog-api-key": api_key},
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=10),
+        )
+
+    async def complete(self, messages: List[dict]) -> str:
+        resp = await self.client.post(f"/models/{self.model}:generateContent", json=self._payload(messages))
+        self._raise_for_status(resp)
+        return self._text(resp.json())
+
+    async def stream(self, messages: List[dict]):
+        async with self.client.stream(
+            "POST", f"/models/{self.model}:streamGenerateContent",
+            params={"alt": "sse"}, json=self._payload(messages),
+        ) as resp:
+            if resp.status_code >= 400:
+                await resp.aread()
+            self._raise_for_status(resp)
+            async for line in resp.aiter_lines():
+                if line.startswith("data:"):
+                    text = self._text(json.loads(line[5:]))
+                    if text:
+                        yield text
+
+    async def aclose(self):
+        await self.client.aclose()
+
+    @staticmethod
+    def _payload(messages: List[dict]) -> dict:
+        system = "\n\n".join(m["content"] for m in messages if m["role"] == "system")
+        payload = {"contents": [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+            for m in messages if m["role"] != "system"
+        ]}
+        if system:
+            payload["systemInstruction"] = {"parts": [{"text": system}]}
+        return payload
+
+    @staticmethod
+    def _raise_for_status(resp: "httpx.Response"):
+        if resp.status_code >= 400:
+            raise LlmProviderError(
+                f"Gemini returned {resp.status_code}: {resp.text[:200]}",
+                retryable=resp.status_code == 429 or resp.status_code >= 500,
+            )
+
+    @staticmethod
+    def _text(data: dict) -> str:
+        candidates = data.get("candidates") or [{}]
+        return "".join(p.get("text", "") for p in candidates[0].get("content", {}).get("parts", []))
+
+class FakeLlmProvider:
+    """Deterministic offline provider: answers after `latency_ms`, streaming word by word."""
+
+    def __init__(self, latency_ms: float):
+        self.latency_ms = latency_ms
+
+    async def complete(self, messages: List[dict]) -> str:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._answer(messages)
+
+    async def stream(self, messages: List[dict]):
+        words = self._answer(messages).split(" ")
+        for word in words:
+            await asyncio.sleep(self.latency_ms / 1000 / len(words))
+            yield word + " "
+
+    async def aclose(self):
+        pass
+
+    @staticmethod
+    def _answer(messages: List[dict]) -> str:
+        question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), "")
+        return f"**Fake answer** ({len(messages)} prompt messages): {question[:200]}"
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "open" if time.monotonic() - self.opened_at < self.reset_seconds else "half-open"
+
+    def before_call(self):
+        # Once reset_seconds have passed, calls go through as probes; one failure reopens
+        if self.state == "open":
+            raise LlmUnavailableError("AI provider unavailable, failing fast")
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+class LlmCallMetrics:
+    """Latency, time to first chunk and token counts of one gateway call."""
+
+    def __init__(self, operation: str, messages: List[dict]):
+        self.operation = operation
+        self.messages = messages
+        self.start = time.perf_counter()
+        self.parts = []
+        self.outcome = "error"
+
+    def queued(self):
+        LLM_QUEUE_SECONDS.observe(time.perf_counter() - self.start)
+
+    def chunk(self, text: str):
+        if not self.parts:
+            LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - self.start)
+        self.parts.append(text)
+
+    def finish(self):
+        elapsed = time.perf_counter() - self.start
+        LLM_REQUEST_SECONDS.observe(elapsed, self.operation, self.outcome)
+        prompt = sum(count_tokens(m["content"]) for m in self.messages)
+        completion = count_tokens("".join(self.parts)) if self.parts else 0
+        LLM_TOKENS.inc(prompt, "prompt")
+        LLM_TOKENS.inc(completion, "completion")
+        trace = _request_trace.get()
+        if trace is not None:
+            trace.add("llm", elapsed)
+            trace.tokens["prompt"] += prompt
+            trace.tokens["completion"] += completion
+
+class LlmGateway:
+    def __init__(self, provider_factory, max_concurrency: int, timeout: float, max_retries: int, breaker: CircuitBreaker):
+        # The provider (and its HTTP client stack) is built on the first LLM call
+        self._provider_factory = provider_factory
+        self._provider = None
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.breaker = breaker
+        self.max_concurrency = max_concurrency
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+
+    @property
+    def provider(self):
+        if self._provider is None:
+            start = time.perf_counter()
+            self._provider = self._provider_factory()
+            logger.info(f"LLM provider {LLM_PROVIDER} loaded in {(time.perf_counter() - start) * 1000:.1f} ms")
+        return self._provider
+
+    @property
+    def provider_loaded(self) -> bool:
+        return self._provider is not None
+
+    async def complete(self, messages: List[dict]) -> str:
+        call = LlmCallMetrics("complete", messages)
+        try:
+            async with self._slots:
+                call.queued()
+                self.in_flight += 1
+                try:
+                    for attempt in range(self.max_retries + 1):
+                        self.breaker.before_call()
+                        try:
+                            text = await asyncio.wait_for(self.provider.complete(messages), self.timeout)
+                        except Exception as e:
+                            error = self._failure(e)
+                            if not error.retryable or attempt == self.max_retries:
+                                raise error from e
+                            await asyncio.sleep(self._backoff(attempt))
+                        else:
+                            self.breaker.record_success()
+                            call.chunk(text)
+                            call.outcome = "ok"
+                            return text
+                finally:
+                    self.in_flight -= 1
+        finally:
+            call.finish()
+
+    async def stream(self, messages: List[dict]):
+        """Yield text chunks. Retries only until the first chunk has been yielded."""
+        call = LlmCallMetrics("stream", messages)
+        try:
+            async with self._slots:
+                call.queued()
+                self.in_flight += 1
+                try:
+                    for attempt in range(self.max_retries + 1):
+                        self.breaker.before_call()
+                        chunks = self.provider.stream(messages)
+                        emitted = False
+                        try:
+                            while True:
+                                try:
+                                    text = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                                except StopAsyncIteration:
+                                    break
+                                emitted = True
+                                call.chunk(text)
+                                yield text
+                            self.breaker.record_success()
+                            call.outcome = "ok"
+                            return
+                        except Exception as e:
+                            error = self._failure(e)
+                            if emitted or not error.retryable or attempt == self.max_retries:
+                                raise error from e
+                            await asyncio.sleep(self._backoff(attempt))
+                        finally:
+                            await chunks.aclose()
+                finally:
+                    self.in_flight -= 1
+        except (GeneratorExit, asyncio.CancelledError):
+            call.outcome = "cancelled"
+            raise
+        finally:
+            call.finish()
+
+    async def aclose(self):
+        if self._provider is not None:
+            await self._provider.aclose()
+
+    def status(self) -> dict:
+        return {
+            "provider": LLM_PROVIDER,
+            "model": LLM_MODEL,
+            "provider_loaded": self.provider_loaded,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+        }
+
+    def _failure(self, e: Exception) -> LlmError:
+        if isinstance(e, LlmError):
+            error = e
+        elif isinstance(e, asyncio.TimeoutError):
+            error = LlmTimeoutError(f"AI provider did not respond within {self.timeout:.0f}s")
+        elif isinstance(e, httpx.TransportError):
+            error = LlmProviderError(f"AI provider connection error: {e}", retryable=True)
+        else:
+            error = LlmProviderError(str(e))
+        if error.retryable:
+            self.breaker.record_failure()
+        return error
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # Full jitter: uniform over [0, 0.5s * 2^attempt], capped at 8s
+        return random.uniform(0, min(8.0, 0.5 * 2 ** attempt))
+
+def make_llm_provider():
+    if LLM_PROVIDER == "fake":
+        return FakeLlmProvider(FAKE_LLM_LATENCY_MS)
+    return GeminiProvider(GEMINI_API_KEY, LLM_MODEL, LLM_MAX_CONCURRENCY)
+
+llm_gateway = LlmGateway(
+    make_llm_provider,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    timeout=LLM_TIMEOUT_SECONDS,
+    max_retries=LLM_MAX_RETRIES,
+    breaker=CircuitBreaker(LLM_BREAKER_THRESHOLD, LLM_BREAKER_RESET_SECONDS),
+)
+
+# ---------- Chat ----------
+
+CHAT_SYSTEM_PROMPT = """You are an AI underwriting assistant for myridius EVOQ Commercial Lending Workbench. You help commercial lending analysts understand loan applications, financial analysis, risk assessments, and AI agent decisions.
+
+RESPONSE FORMAT RULES:
+- Always respond in plain, natural language — NEVER return JSON, code blocks, or raw data structures.
+- Be concise and to the point. Use short bullet points when listing multiple items.
+- Use markdown formatting: **bold** for emphasis, bullet points (- or *) for lists.
+- Keep responses brief (3-5 bullet points max) unless the user explicitly asks for a detailed explanation.
+- When referencing financial data, present it naturally (e.g., "Tesla's D/E ratio improved from 0.79 to 0.68") — never dump raw numbers or objects.
+- Sound like a knowledgeable analyst having a conversation, not a database query."""
+
+def chat_message(body: ChatRequest, role: str, content: str) -> dict:
+    """A chat_messages document, timestamped now; persisted through `chat_writer`."""
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": body.session_id,
+        "application_id": body.application_id,
+        "role": role,
+        "content": content,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+
+def render_chat_context(app_data: dict) -> str:
+    """Application context block for the chat system prompt.
+
+    Rendered once per application write and stored as `chat_context`. Review status
+    is left out because it changes independently; build_chat_prompt appends it.
+    """
+    # Provide structured summary instead of raw JSON dump
+    context_parts = [
+        f"Applicant: {app_data.get('applicant_name')} ({app_data.get('application_no')})",
+        f"Industry: {app_data.get('industry')} | Entity: {app_data.get('legal_entity_type')}",
+        f"Loan: {app_data.get('loan_amount_display')} | Stage: {app_data.get('application_stage')}",
+        f"AI Status: {app_data.get('application_status')}",
+        f"AI Recommendation: {app_data.get('ai_recommendation', {}).get('action')} — {app_data.get('ai_recommendation', {}).get('notes')}",
+        f"Summary: {app_data.get('application_summary')}",
+        f"Insights: {app_data.get('insights_synthesis')}",
+    ]
+    if app_data.get('company_insights'):
+        context_parts.append("Key Insights:\n" + "\n".join(f"  - {i}" for i in app_data['company_insights']))
+    if app_data.get('key_ratios'):
+        de = app_data['key_ratios'].get('debt_to_equity', [])
+        icr = app_data['key_ratios'].get('interest_coverage', [])
+        if de:
+            de_str = ', '.join(str(d['year']) + ': ' + str(d['value']) for d in de)
+            context_parts.append(f"D/E Ratio: {de_str}")
+        if icr:
+            icr_str = ', '.join(str(d['year']) + ': ' + str(d['value']) + 'x' for d in icr)
+            context_parts.append(f"ICR: {icr_str}")
+    if app_data.get('covenant_recommendations'):
+        cov_str = "; ".join(str(c['value']) + ' ' + str(c['metric']) for c in app_data['covenant_recommendations'])
+        context_parts.append(f"Covenants: {cov_str}")
+    return "\n".join(context_parts)
+
+def derived_fields(app: dict) -> dict:
+    """Fields computed from an application document; recompute whenever its content is written."""
+    return {"search_terms": build_search_terms(app), "chat_context": render_chat_context(app)}
+
+# All a chat turn needs from the application: the precomputed context block, plus review
+# status and updated_at. The application cache narrows to these whether or not it hits.
+CHAT_APPLICATION_PROJECTION = {"_id": 0, "chat_context": 1, "review_status": 1, "updated_at": 1}
+
+async def load_chat_application(application_id: Optional[str]) -> Optional[dict]:
+    if not application_id:
+        return None
+    app_data = await application_cache.get(application_id, CHAT_APPLICATION_PROJECTION)
+    if app_data is not None and "chat_context" not in app_data:
+        # Written before chat_context existed and not yet backfilled
+        full = await db.applications.find_one({"id": application_id}, {"_id": 0})
+        if full is None:
+            return None
+        app_data = {**app_data, "chat_context": render_chat_context(full)}
+        await db.applications.update_one({"id": application_id}, {"$set": {"chat_context": app_data["chat_context"]}})
+        application_cache.invalidate([application_id])
+    return app_data
+
+async def build_chat_prompt(body: ChatRequest, app_data: Optional[dict]):
+    """System prompt (with application context) and prior conversation for a chat turn."""
+    system_prompt = CHAT_SYSTEM_PROMPT
+
+    if app_data:
+        system_prompt += (
+            "\n\nCurrent application context:\n" + app_data["chat_context"]
+            + f"\nReview Status: {app_data.get('review_status')}"
+        )
+
+    session = await db.chat_sessions.find_one({"session_id": body.session_id}, {"_id": 0, "summary": 1, "summarized_until": 1})
+    if session and session.get("summary"):
+        system_prompt += f"\n\nSummary of the earlier conversation:\n{session['summary']}"
+
+    # Newest completed turns first, including ones still buffered, kept while they fit the budget
+    pending = [m for m in chat_writer.pending(body.session_id) if m.get("status") != "failed"]
+    stored = await db.chat_messages.find(
+        {"session_id": body.session_id, "status": {"$ne": "failed"}},
+        {"_id": 0, "id": 1, "role": 1, "content": 1, "timestamp": 1}
+    ).sort("timestamp", -1).limit(CHAT_HISTORY_FETCH_LIMIT).to_list(CHAT_HISTORY_FETCH_LIMIT)
+    recent = merge_messages(stored, pending, newest_first=True)[:CHAT_HISTORY_FETCH_LIMIT]
+
+    history = []
+    budget = CHAT_HISTORY_TOKEN_BUDGET
+    for msg in recent:
+        content = truncate_to_tokens(msg["content"], CHAT_MESSAGE_TOKEN_LIMIT)
+        tokens = count_tokens(content)
+        if tokens > budget:
+            break
+        budget -= tokens
+        history.append({"role": msg["role"], "content": content, "timestamp": msg["timestamp"]})
+    history.reverse()
+
+    if len(history) < len(recent) or len(recent) == CHAT_HISTORY_FETCH_LIMIT:
+        # Older turns fell out of the window; fold them into the running summary once
+        # CHAT_SUMMARY_MIN_MESSAGES have piled up, rather than on every turn
+        window_start = history[0]["timestamp"] if history else recent[0]["timestamp"]
+        unsummarized = await db.chat_messages.count_documents({
+            "session_id": body.session_id,
+            "timestamp": {"$gt": (session or {}).get("summarized_until", ""), "$lt": window_start},
+            "status": {"$ne": "failed"},
+        }, limit=CHAT_SUMMARY_MIN_MESSAGES)
+        if unsummarized >= CHAT_SUMMARY_MIN_MESSAGES:
+            schedule_summary_update(body.session_id, window_start)
+
+    # Build initial_messages with system prompt + conversation history
+    initial_messages = [{"role": "system", "content": system_prompt}]
+    for msg in history:
+        initial_messages.append({"role": msg["role"], "content": msg["content"]})
+
+    prompt_tokens = sum(count_tokens(m["content"]) for m in initial_messages) + count_tokens(body.message)
+    logger.info(f"Chat prompt for session {body.session_id}: {prompt_tokens} tokens, {len(history)} history messages")
+    return system_prompt, initial_messages, prompt_tokens
+
+# ---------- Conversation Window ----------
+# History sent with each turn is bounded by tokens, not message count. Turns that fall out
+# of the window are folded into a per-session running summary (chat_sessions) in the
+# background, so the model keeps the gist of long sessions without resending them.
+CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get('CHAT_HISTORY_TOKEN_BUDGET', '2000'))
+CHAT_MESSAGE_TOKEN_LIMIT = int(os.environ.get('CHAT_MESSAGE_TOKEN_LIMIT', '1000'))
+CHAT_HISTORY_FETCH_LIMIT = 50
+CHAT_SUMMARY_BATCH = 100
+CHAT_SUMMARY_MIN_MESSAGES = int(os.environ.get('CHAT_SUMMARY_MIN_MESSAGES', '10'))
+
+SUMMARY_SYSTEM_PROMPT = """You maintain a running summary of a commercial lending underwriting chat session. Given the current summary and the messages that followed it, return an updated summary of at most 200 words. Keep figures, decisions, concerns and open questions; drop pleasantries. Plain text only."""
+
+# Token counts are a chars/4 estimate by default: the budget is approximate anyway, and
+# Gemini's tokenizer is not available offline. CHAT_TOKENIZER=cl100k counts with tiktoken
+# instead; the encoding is loaded once at startup off the event loop (a cold tiktoken cache
+# downloads it), and counting keeps estimating if that fails or times out.
+CHAT_TOKENIZER = os.environ.get('CHAT_TOKENIZER', 'estimate')  # estimate | cl100k
+TOKENIZER_LOAD_TIMEOUT_SECONDS = float(os.environ.get('TOKENIZER_LOAD_TIMEOUT_SECONDS', '10'))
+
+_token_encoder = None
+
+def _load_cl100k():
+    import tiktoken
+    return tiktoken.get_encoding("cl100k_base")
+
+async def load_token_encoder():
+    global _token_encoder
+    if CHAT_TOKENIZER != "cl100k":
+        return
+    try:
+        _token_encoder = await asyncio.wait_for(asyncio.to_thread(_load_cl100k), TOKENIZER_LOAD_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.warning(f"cl100k tokenizer unavailable, estimating token counts: {e!r}")
+
+def count_tokens(text: str) -> int:
+    """Token count with the cl100k encoding once loaded, otherwise a chars/4 estimate."""
+    if _token_encoder is not None:
+        return len(_token_encoder.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+def truncate_to_tokens(text: str, limit: int) -> str:
+    if count_tokens(text) <= limit:
+        return text
+    # Proportional cut; close enough for a per-message cap
+    return text[:int(len(text) * limit / count_tokens(text))] + " …"
+
+_summaries_in_progress = set()
+_background_tasks = set()
+
+def schedule_summary_update(session_id: str, window_start: str):
+    if session_id in _summaries_in_progress:
+        return
+    _summaries_in_progress.add(session_id)
+    task = asyncio.create_task(update_session_summary(session_id, window_start))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+async def update_session_summary(session_id: str, window_start: str):
+    """Fold messages older than the current window into the session's running summary."""
+    try:
+        session = await db.chat_sessions.find_one({"session_id": session_id}, {"_id": 0}) or {}
+        summarized_until = session.get("summarized_until", "")
+        pending = await db.chat_messages.find(
+            {"session_id": session_id, "timestamp": {"$gt": summarized_until, "$lt": window_start}, "status": {"$ne": "failed"}},
+            {"_id": 0, "role": 1, "content": 1, "timestamp": 1}
+        ).sort("timestamp", 1).limit(CHAT_SUMMARY_BATCH).to_list(CHAT_SUMMARY_BATCH)
+        if not pending:
+            return
+
+        transcript = "\n".join(
+            f"{m['role']}: {truncate_to_tokens(m['content'], CHAT_MESSAGE_TOKEN_LIMIT)}" for m in pending
+        )
+        summary = await llm_gateway.complete([
+            {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Current summary:\n{session.get('summary') or '(none)'}\n\nNewer messages:\n{transcript}"},
+        ])
+
+        await db.chat_sessions.update_one(
+            {"session_id": session_id},
+            {"$set": {
+                "summary": summary,
+                "summarized_until": pending[-1]["timestamp"],
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.error(f"Chat summary update failed for session {session_id}: {e}")
+    finally:
+        _summaries_in_progress.discard(session_id)
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+# ---------- Chat Persistence ----------
+# A chat turn (user message + reply) is written once, after the reply exists, through a
+# buffer that flushes with insert_many. A turn whose reply never arrives is written as a
+# single user message with status "failed" rather than left looking unanswered.
+# CHAT_WRITE_MODE picks the durability/latency trade-off:
+#   sync            flush the turn before responding; majority, journaled write concern
+#   batched         buffer; flush every CHAT_FLUSH_INTERVAL_MS or CHAT_FLUSH_MAX_MESSAGES,
+#                   acknowledged writes; a crash loses at most one interval
+#   fire_and_forget as batched, with unacknowledged (w=0) writes
+# Buffered messages are merged into history reads, and the buffer is flushed on shutdown.
+CHAT_WRITE_MODE = os.environ.get('CHAT_WRITE_MODE', 'batched')
+CHAT_FLUSH_INTERVAL_MS = int(os.environ.get('CHAT_FLUSH_INTERVAL_MS', '200'))
+CHAT_FLUSH_MAX_MESSAGES = int(os.environ.get('CHAT_FLUSH_MAX_MESSAGES', '100'))
+# Failed flushes retry a message this many times before it is dead-lettered (logged and
+# dropped); messages Mongo rejects outright (e.g. validation) are dead-lettered at once
+CHAT_FLUSH_MAX_ATTEMPTS = int(os.environ.get('CHAT_FLUSH_MAX_ATTEMPTS', '5'))
+CHAT_DEAD_LETTER_LIMIT = 1000
+
+CHAT_WRITE_CONCERNS = {
+    "sync": WriteConcern(w="majority", j=True),
+    "batched": WriteConcern(w=1),
+    "fire_and_forget": WriteConcern(w=0),
+}
+
+class ChatWriteError(Exception):
+    """A sync-mode write did not land; the turn was discarded, so the client may resend it."""
+
+def merge_messages(stored: List[dict], pending: List[dict], newest_first: bool = False) -> List[dict]:
+    """Union of stored and buffered messages by id, ordered by (timestamp, id)."""
+    by_id = {m["id"]: m for m in pending}
+    by_id.update((m["id"], m) for m in stored)
+    return sorted(by_id.values(), key=lambda m: (m["timestamp"], m["id"]), reverse=newest_first)
+
+class ChatMessageWriter:
+    def __init__(self, collection, mode: str, flush_interval_ms: int, max_messages: int):
+        if mode not in CHAT_WRITE_CONCERNS:
+            raise ValueError(f"Unknown CHAT_WRITE_MODE '{mode}'")
+        self.mode = mode
+        self.collection = collection.with_options(write_concern=CHAT_WRITE_CONCERNS[mode])
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_messages = max_messages
+        self._buffer = []
+        # Messages handed to insert_many but not yet acknowledged; still visible to reads
+        self._in_flight = []
+        self._lock = asyncio.Lock()
+        self._task = None
+        self._attempts = {}  # message id -> failed flush attempts
+        self.dead_letters = deque(maxlen=CHAT_DEAD_LETTER_LIMIT)
+        self.flushes = 0
+        self.failed_flushes = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._buffer:
+            logger.error(f"Chat writer shut down with {len(self._buffer)} unsaved messages")
+
+    @property
+    def buffered(self) -> int:
+        return len(self._buffer)
+
+    def pending(self, session_id: str) -> List[dict]:
+        return [m for m in self._in_flight + self._buffer if m["session_id"] == session_id]
+
+    def enqueue(self, *messages: dict):
+        """Buffer messages without waiting on any write (safe from cancelled tasks)."""
+        self._buffer.extend(messages)
+
+    async def write_turn(self, user_msg: dict, assistant_msg: dict):
+        await self._write(user_msg, assistant_msg)
+
+    async def write_failed_turn(self, user_msg: dict, error: str):
+        await self._write({**user_msg, "status": "failed", "error": error[:500]})
+
+    async def _write(self, *messages: dict):
+        self.enqueue(*messages)
+        if self.mode == "sync":
+            await self.flush()
+            ids = {m["id"] for m in messages}
+            unsaved = [m for m in list(self._buffer) + list(self.dead_letters) if m["id"] in ids]
+            if unsaved:
+                # Not left for the flush loop: the client is told to resend, which would duplicate the turn
+                self._buffer = [m for m in self._buffer if m["id"] not in ids]
+                for message_id in ids:
+                    self._attempts.pop(message_id, None)
+                raise ChatWriteError(f"Chat messages for session {messages[0]['session_id']} were not saved")
+        elif len(self._buffer) >= self.max_messages:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            if not self._buffer:
+                return
+            batch, self._buffer = self._buffer, []
+            self._in_flight = batch
+            retry = []
+            try:
+                # insert_many adds _id to what it is given; keep the buffered dicts clean
+                await self.collection.insert_many([dict(m) for m in batch], ordered=False)
+            except BulkWriteError as e:
+                # Duplicate ids were already written by an earlier, partly failed flush; any
+                # other per-document error will fail the same way again
+                rejected = {err["index"]: err.get("errmsg", "") for err in e.details.get("writeErrors", [])
+                            if err.get("code") != 11000}
+                for index, reason in rejected.items():
+                    self._dead_letter(batch[index], reason)
+            except PyMongoError as e:
+                logger.error(f"Chat message flush of {len(batch)} messages failed: {e}")
+                retry = batch
+            except asyncio.CancelledError:
+                # Cancelled mid-insert (e.g. by close()); what did land is skipped as a duplicate next time
+                self._buffer = batch + self._buffer
+                raise
+            finally:
+                self._in_flight = []
+            self.flushes += 1
+            retry_ids = {m["id"] for m in retry}
+            for message in batch:
+                if message["id"] not in retry_ids:
+                    self._attempts.pop(message["id"], None)
+            if retry:
+                self.failed_flushes += 1
+                requeue = []
+                for message in retry:
+                    attempts = self._attempts[message["id"]] = self._attempts.get(message["id"], 0) + 1
+                    if attempts >= CHAT_FLUSH_MAX_ATTEMPTS:
+                        self._dead_letter(message, f"gave up after {attempts} attempts")
+                    else:
+                        requeue.append(message)
+                self._buffer = requeue + self._buffer
+
+    def _dead_letter(self, message: dict, reason: str):
+        self._attempts.pop(message["id"], None)
+        self.dead_letters.append({**message, "dead_letter_reason": reason})
+        logger.error(f"Chat message {message['id']} (session {message['session_id']}) dropped: {reason}")
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Chat writer flush loop error: {e}")
+
+chat_writer = ChatMessageWriter(db.chat_messages, CHAT_WRITE_MODE, CHAT_FLUSH_INTERVAL_MS, CHAT_FLUSH_MAX_MESSAGES)
+
+# ---------- Answer Cache ----------
+# Exact-match cache of assistant answers keyed on (application_id, application updated_at,
+# normalized question, model, digest of the prompt context). Keying on updated_at means an
+# edited application never serves a stale answer; invalidate_application additionally
+# frees the old entries. The context digest covers the system prompt, session summary and
+# history window, so a follow-up like "why?" is only answered from cache when the
+# conversation it follows is the same, in practice mostly opening questions.
+CHAT_CACHE_BACKEND = os.environ.get('CHAT_CACHE_BACKEND', 'memory')  # memory | mongo | off
+CHAT_CACHE_TTL_SECONDS = int(os.environ.get('CHAT_CACHE_TTL_SECONDS', '3600'))
+CHAT_CACHE_MAX_ENTRIES = int(os.environ.get('CHAT_CACHE_MAX_ENTRIES', '1000'))
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question.lower()).strip().rstrip("?!. ")
+
+class MemoryAnswerStore:
+    """In-process LRU with TTL. Per worker; lost on restart."""
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # key -> (answer, latency_ms, application_id, expires_at)
+        self._by_application = {}  # application_id -> {key}
+
+    async def get(self, key: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[3] < time.monotonic():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[0], entry[1]
+
+    async def set(self, key: str, application_id: Optional[str], answer: str, latency_ms: float):
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (answer, latency_ms, application_id, time.monotonic() + self.ttl_seconds)
+        self._by_application.setdefault(application_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._remove(next(iter(self._entries)))
+
+    async def invalidate_applications(self, application_ids: List[str]):
+        for application_id in application_ids:
+            for key in self._by_application.pop(application_id, set()):
+                self._entries.pop(key, None)
+
+    async def clear(self):
+        self._entries.clear()
+        self._by_application.clear()
+
+    async def size(self) -> int:
+        return len(self._entries)
+
+    def _remove(self, key: str):
+        _, _, application_id, _ = self._entries.pop(key)
+        keys = self._by_application.get(application_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_application[application_id]
+
+class MongoAnswerStore:
+    """Shared across workers. Mongo's TTL monitor expires entries; LRU trimming runs
+    every `trim_every` writes against last_hit_at."""
+
+    def __init__(self, collection, max_entries: int, ttl_seconds: int, trim_every: int = 50):
+        self.collection = collection
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.trim_every = trim_every
+        self._writes = 0
+
+    async def get(self, key: str):
+        now = datetime.now(timezone.utc)
+        entry = await self.collection.find_one_and_update(
+            {"_id": key, "expires_at": {"$gt": now}},
+            {"$set": {"last_hit_at": now}},
+            projection={"answer": 1, "latency_ms": 1},
+        )
+        if entry is None:
+            return None
+        return entry["answer"], entry["latency_ms"]
+
+    async def set(self, key: str, application_id: Optional[str], answer: str, latency_ms: float):
+        now = datetime.now(timezone.utc)
+        await self.collection.update_one({"_id": key}, {"$set": {
+            "application_id": application_id,
+            "answer": answer,
+            "latency_ms": latency_ms,
+            "last_hit_at": now,
+            "expires_at": now + timedelta(seconds=self.ttl_seconds),
+        }}, upsert=True)
+        self._writes += 1
+        if self._writes % self.trim_every == 0:
+            await self._trim()
+
+    async def invalidate_applications(self, application_ids: List[str]):
+        await self.collection.delete_many({"application_id": {"$in": application_ids}})
+
+    async def clear(self):
+        await self.collection.delete_many({})
+
+    async def size(self) -> int:
+        return await self.collection.estimated_document_count()
+
+    async def _trim(self):
+        excess = await self.collection.count_documents({}) - self.max_entries
+        if excess > 0:
+            stale = await self.collection.find({}, {"_id": 1}).sort("last_hit_at", 1).limit(excess).to_list(excess)
+            await self.collection.delete_many({"_id": {"$in": [e["_id"] for e in stale]}})
+
+class AnswerCache:
+    def __init__(self, store):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+        self.saved_latency_ms = 0.0
+
+    @staticmethod
+    def key(application_id: Optional[str], version: Optional[str], question: str, model: str, context: str = "") -> str:
+        raw = json.dumps([application_id, version, normalize_question(question), model, context])
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        if self.store is None:
+            return None
+        entry = await self.store.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        answer, latency_ms = entry
+        self.hits += 1
+        self.saved_latency_ms += latency_ms
+        return answer
+
+    async def set(self, key: str, application_id: Optional[str], answer: str, latency_ms: float):
+        if self.store is not None:
+            await self.store.set(key, application_id, answer, latency_ms)
+
+    async def invalidate_application(self, application_id: str):
+        await self.invalidate_applications([application_id])
+
+    async def invalidate_applications(self, application_ids: List[str]):
+        if self.store is not None and application_ids:
+            await self.store.invalidate_applications(application_ids)
+
+    async def clear(self):
+        if self.store is not None:
+            await self.store.clear()
+
+    async def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "backend": CHAT_CACHE_BACKEND,
+            "size": await self.store.size() if self.store is not None else 0,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "saved_latency_ms": round(self.saved_latency_ms, 1),
+        }
+
+def make_answer_store():
+    if CHAT_CACHE_BACKEND == "memory":
+        return MemoryAnswerStore(CHAT_CACHE_MAX_ENTRIES, CHAT_CACHE_TTL_SECONDS)
+    if CHAT_CACHE_BACKEND == "mongo":
+        return MongoAnswerStore(db.chat_answer_cache, CHAT_CACHE_MAX_ENTRIES, CHAT_CACHE_TTL_SECONDS)
+    return None
+
+answer_cache = AnswerCache(make_answer_store())
+
+def chat_cache_key(body: ChatRequest, app_data: Optional[dict], initial_messages: List[dict]) -> str:
+    version = app_data.get("updated_at") if app_data else None
+    context = hashlib.sha256(json.dumps(initial_messages).encode()).hexdigest()
+    return AnswerCache.key(body.application_id, version, body.message, f"{LLM_PROVIDER}/{LLM_MODEL}", context)
+
+# ---------- Chat Admission ----------
+# A double-submitted turn (same session, application and message) joins the one already
+# in flight and returns its response, without a second LLM call or a duplicate
+# transcript entry. Turns are only shared within a session: the prompt carries that
+# session's history. Turns that do need the LLM are admitted
+# through per-session and global limits with a bounded wait queue; beyond those the
+# request fails fast with 429 and a Retry-After estimate.
+CHAT_MAX_CONCURRENCY = int(os.environ.get('CHAT_MAX_CONCURRENCY', str(LLM_MAX_CONCURRENCY)))
+CHAT_MAX_PER_SESSION = int(os.environ.get('CHAT_MAX_PER_SESSION', '2'))
+CHAT_MAX_QUEUE = int(os.environ.get('CHAT_MAX_QUEUE', '64'))
+CHAT_QUEUE_TIMEOUT_SECONDS = float(os.environ.get('CHAT_QUEUE_TIMEOUT_SECONDS', '10'))
+
+def settle(future: asyncio.Future, outcome):
+    """Resolve `future` with a result, or an exception instance, unless already done."""
+    if future.done():
+        return
+    if isinstance(outcome, BaseException):
+        future.set_exception(outcome)
+    else:
+        future.set_result(outcome)
+
+class SingleFlight:
+    """Run one task per key; concurrent callers with the same key await its result."""
+
+    def __init__(self, kind: str):
+        self.kind = kind
+        self._tasks = {}
+
+    async def do(self, key, fn):
+        task = self._tasks.get(key)
+        if task is None:
+            # A task, so one caller going away does not cancel the work the others wait on
+            task = self._tasks[key] = asyncio.create_task(fn())
+            task.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            CHAT_COALESCED.inc(1, self.kind)
+        return await asyncio.shield(task)
+
+    def running(self, key) -> Optional[asyncio.Future]:
+        return self._tasks.get(key)
+
+    def claim(self, key, timeout: float) -> asyncio.Future:
+        """Register work the caller runs itself (a stream); the caller settles the future.
+
+        Duplicates join it through do() or running() until it is settled. It fails on its
+        own after `timeout`, in case the owner never runs (a client that left early).
+        """
+        loop = asyncio.get_running_loop()
+        future = self._tasks[key] = loop.create_future()
+        future.add_done_callback(lambda done: self._finished(key, done))
+        expiry = loop.call_later(timeout, settle, future, HTTPException(status_code=503, detail="Chat turn timed out, try again"))
+        future.add_done_callback(lambda done: expiry.cancel())
+        return future
+
+    def _finished(self, key, task: asyncio.Future):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if not task.cancelled():
+            task.exception()  # retrieved even when every caller has gone away
+
+    def __len__(self):
+        return len(self._tasks)
+
+class ChatAdmission:
+    def __init__(self, max_concurrency: int, max_per_session: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_per_session = max_per_session
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._sessions = {}  # session_id -> admitted or waiting turns
+        self.active = 0
+        self.waiting = 0
+        self._avg_seconds = 5.0  # EWMA of slot hold time, for Retry-After
+
+    def check(self, session_id: str):
+        """Raise 429 now if `acquire` would be turned away without waiting."""
+        if self._sessions.get(session_id, 0) >= self.max_per_session:
+            self._reject("session", "Too many chat requests in progress for this session")
+        if self._slots.locked() and self.waiting >= self.max_queue:
+            self._reject("queue_full", "Chat is at capacity, try again shortly")
+
+    async def acquire(self, session_id: str):
+        self.check(session_id)
+        self._sessions[session_id] = self._sessions.get(session_id, 0) + 1
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._leave(session_id)
+            self._reject("queue_timeout", "Chat is at capacity, try again shortly")
+        except BaseException:
+            self._leave(session_id)
+            raise
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        return time.monotonic()
+
+    def release(self, session_id: str, acquired_at: float):
+        self.active -= 1
+        self._slots.release()
+        self._leave(session_id)
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (time.monotonic() - acquired_at)
+
+    @contextlib.asynccontextmanager
+    async def slot(self, session_id: str):
+        acquired_at = await self.acquire(session_id)
+        try:
+            yield
+        finally:
+            self.release(session_id, acquired_at)
+
+    def retry_after(self) -> int:
+        # Time for the queue ahead to drain through the slots, at the recent hold time
+        rounds = (self.waiting + 1) / max(self.max_concurrency, 1)
+        return max(1, min(60, round(rounds * self._avg_seconds)))
+
+    def status(self) -> dict:
+        return {
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_concurrency": self.max_concurrency,
+            "max_per_session": self.max_per_session,
+            "max_queue": self.max_queue,
+            "sessions": len(self._sessions),
+            "in_flight_turns": len(chat_turns),
+        }
+
+    def _leave(self, session_id: str):
+        remaining = self._sessions.get(session_id, 0) - 1
+        if remaining > 0:
+            self._sessions[session_id] = remaining
+        else:
+            self._sessions.pop(session_id, None)
+
+    def _reject(self, reason: str, detail: str):
+        CHAT_REJECTED.inc(1, reason)
+        raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(self.retry_after())})
+
+chat_admission = ChatAdmission(CHAT_MAX_CONCURRENCY, CHAT_MAX_PER_SESSION, CHAT_MAX_QUEUE, CHAT_QUEUE_TIMEOUT_SECONDS)
+chat_turns = SingleFlight("turn")
+
+def chat_turn_key(body: ChatRequest) -> tuple:
+    return body.session_id, body.application_id, normalize_question(body.message)
+
+# Longest a claimed stream turn can legitimately run: queueing plus every LLM attempt
+CHAT_TURN_TIMEOUT_SECONDS = CHAT_QUEUE_TIMEOUT_SECONDS + LLM_TIMEOUT_SECONDS * (LLM_MAX_RETRIES + 1)
+
+# ---------- Analysis Jobs ----------
+# Mongo-backed queue for (re)generating the AI sections of an application. Workers claim
+# jobs atomically with find_one_and_update (highest priority, then oldest), hold a lease
+# while running, and retry failures with backoff. A job whose lease expires (worker
+# crashed or was restarted) is picked up again while it has attempts left. Requesting a
+# job that failed for good requeues it.
+ANALYSIS_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', '2'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '3'))
+JOB_LEASE_SECONDS = int(os.environ.get('JOB_LEASE_SECONDS', '300'))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', '1'))
+
+ANALYSIS_SYSTEM_PROMPT = """You are the underwriting AI agent for a commercial lending workbench. Given an application's data, regenerate the requested analysis sections. Respond with a single JSON object and nothing else."""
+
+# What each section's value must look like before it is written to the document
+ANALYSIS_SECTION_TYPES = {
+    "ai_recommendation": TypeAdapter(AiRecommendation),
+    "insights_synthesis": TypeAdapter(str),
+    "financial_analysis": TypeAdapter(str),
+    "macro_analysis": TypeAdapter(MacroAnalysis),
+}
+
+# What the model must return for each section, and where it is written on the document
+ANALYSIS_SECTION_SPECS = {
+    "ai_recommendation": ('"ai_recommendation": {"action": "Approve Loan" | "Reject Loan" | "Hold", "notes": string}', "ai_recommendation"),
+    "insights_synthesis": ('"insights_synthesis": string (2-3 sentences)', "insights_synthesis"),
+    "financial_analysis": ('"financial_analysis_summary": string (2-3 sentences on the financials)', "financial_analysis.summary"),
+    "macro_analysis": (
+        '"macro_analysis": {"summary": string, "porters_forces": {"buyer_power" | "supplier_power" | '
+        '"threat_new_entrants" | "threat_substitutes" | "competitive_rivalry": {"score": 1-5, "description": string}}}',
+        "macro_analysis",
+    ),
+}
+
+_worker_tasks = []
+
+async def enqueue_analysis_job(application_id: str, request: AnalysisJobRequest) -> dict:
+    """Insert a job, or return the existing one with the same idempotency key.
+
+    Without an explicit key, the key is derived from the application version and the
+    sections, so repeated requests for an unchanged application share one job. A job
+    that has failed for good is requeued with fresh attempts rather than returned.
+    """
+    app_data = await db.applications.find_one({"id": application_id}, {"_id": 0, "updated_at": 1})
+    if not app_data:
+        raise HTTPException(status_code=404, detail="Application not found")
+    sections = sorted(set(request.sections))
+    key = request.idempotency_key or f"analysis:{application_id}:{app_data.get('updated_at')}:{','.join(sections)}"
+
+    now = datetime.now(timezone.utc)
+    retried = await db.jobs.find_one_and_update(
+        {"idempotency_key": key, "status": "failed"},
+        {"$set": {
+            "status": "queued",
+            "attempts": 0,
+            "max_attempts": JOB_MAX_ATTEMPTS,
+            "priority": request.priority,
+            "error": None,
+            "run_after": now,
+            "lease_expires_at": None,
+            "updated_at": now.isoformat(),
+        }},
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+    if retried:
+        return retried
+    existing = await db.jobs.find_one({"idempotency_key": key}, {"_id": 0})
+    if existing:
+        return existing
+    job = {
+        "id": str(uuid.uuid4()),
+        "type": "analysis",
+        "application_id": application_id,
+        "sections": sections,
+        "priority": request.priority,
+        "idempotency_key": key,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": JOB_MAX_ATTEMPTS,
+        "error": None,
+        "run_after": now,
+        "lease_expires_at": None,
+        "created_at": now.isoformat(),
+        "updated_at": now.isoformat(),
+    }
+    try:
+        await db.jobs.insert_one(job)
+    except DuplicateKeyError:
+        # Lost a race with an identical request
+        return await db.jobs.find_one({"idempotency_key": key}, {"_id": 0})
+    job.pop("_id", None)
+    return job
+
+async def claim_job() -> Optional[dict]:
+    now = datetime.now(timezone.utc)
+    return await db.jobs.find_one_and_update(
+        {"$or": [
+            {"status": "queued", "run_after": {"$lte": now}},
+            # An expired lease is another attempt, so only while attempts remain
+            {"status": "running", "lease_expires_at": {"$lt": now}, "$expr": {"$lt": ["$attempts", "$max_attempts"]}},
+        ]},
+        {
+            "$set": {
+                "status": "running",
+                "lease_expires_at": now + timedelta(seconds=JOB_LEASE_SECONDS),
+                "started_at": now.isoformat(),
+                "updated_at": now.isoformat(),
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("priority", -1), ("created_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+    )
+
+async def fail_exhausted_jobs():
+    """Fail jobs whose lease expired on their last attempt; claim_job no longer takes them."""
+    now = datetime.now(timezone.utc)
+    await db.jobs.update_many(
+        {"status": "running", "lease_expires_at": {"$lt": now}, "$expr": {"$gte": ["$attempts", "$max_attempts"]}},
+        {"$set": {
+            "status": "failed",
+            "error": "Lease expired on the final attempt",
+            "lease_expires_at": None,
+            "updated_at": now.isoformat(),
+        }},
+    )
+
+def parse_analysis_response(text: str, sections: List[str]) -> dict:
+    """Map the model's JSON answer to the document fields it updates."""
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    data = json.loads(text)
+    updates = {}
+    for section in sections:
+        field = ANALYSIS_SECTION_SPECS[section][1]
+        key = "financial_analysis_summary" if section == "financial_analysis" else section
+        if key not in data:
+            raise ValueError(f"AI response is missing '{key}'")
+        # Reject malformed sections here rather than store something the detail view can't serve
+        value = ANALYSIS_SECTION_TYPES[section].validate_python(data[key])
+        updates[field] = value.model_dump() if isinstance(value, BaseModel) else value
+    return updates
+
+async def run_analysis_job(job: dict):
+    app_data = await db.applications.find_one({"id": job["application_id"]}, APPLICATION_PROJECTION)
+    if not app_data:
+        raise ValueError("Application no longer exists")
+
+    fields = "\n".join(f"- {ANALYSIS_SECTION_SPECS[s][0]}" for s in job["sections"])
+    prompt = (
+        f"Application:\n{render_chat_context(app_data)}\n"
+        f"Financials (revenue $B, operating margin %): {json.dumps(app_data.get('financial_analysis', {}).get('financials', []))}\n\n"
+        f"Return a JSON object with these keys:\n{fields}"
+    )
+    text = await llm_gateway.complete([
+        {"role": "system", "content": ANALYSIS_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ])
+    updates = parse_analysis_response(text, job["sections"])
+
+    # Re-derive the stored chat context from the document as it will look after the update
+    merged = copy.deepcopy(app_data)
+    for field, value in updates.items():
+        target = merged
+        *parents, leaf = field.split(".")
+        for parent in parents:
+            target = target.setdefault(parent, {})
+        target[leaf] = value
+    now = datetime.now(timezone.utc).isoformat()
+    await db.applications.update_one(
+        {"id": job["application_id"]},
+        {"$set": {**updates, "chat_context": render_chat_context(merged), "updated_at": now}, "$inc": {"version": 1}},
+    )
+    application_cache.invalidate([job["application_id"]])
+    await bump_applications_version()
+    await answer_cache.invalidate_application(job["application_id"])
+    return list(updates)
+
+async def analysis_worker(worker_no: int):
+    while True:
+        try:
+            job = await claim_job()
+            if job is None:
+                await fail_exhausted_jobs()
+        except Exception as e:
+            logger.error(f"Analysis worker {worker_no} could not claim a job: {e}")
+            job = None
+        if job is None:
+            await asyncio.sleep(JOB_POLL_SECONDS)
+            continue
+
+        now = datetime.now(timezone.utc)
+        try:
+            updated = await run_analysis_job(job)
+        except asyncio.CancelledError:
+            # Shutting down: hand the job back instead of waiting for the lease to expire
+            await db.jobs.update_one({"id": job["id"]}, {"$set": {"status": "queued", "lease_expires_at": None}})
+            raise
+        except Exception as e:
+            retry = job["attempts"] < job["max_attempts"]
+            logger.error(f"Analysis job {job['id']} attempt {job['attempts']} failed: {e}")
+            await db.jobs.update_one({"id": job["id"]}, {"$set": {
+                "status": "queued" if retry else "failed",
+                "error": str(e),
+                "run_after": now + timedelta(seconds=min(300, 5 * 2 ** job["attempts"])),
+                "lease_expires_at": None,
+                "updated_at": now.isoformat(),
+            }})
+        else:
+            await db.jobs.update_one({"id": job["id"]}, {"$set": {
+                "status": "succeeded",
+                "error": None,
+                "updated_fields": updated,
+                "lease_expires_at": None,
+                "finished_at": datetime.now(timezone.utc).isoformat(),
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }})
+
+# ---------- Live Feed ----------
+# One watcher per process follows `applications` and fans compact diffs out to every
+# WebSocket subscriber. It uses a change stream when the deployment supports one
+# (replica set / Atlas) and otherwise polls with an (updated_at, id) watermark.
+# Each subscriber coalesces pending diffs per application, so a slow client receives
+# the latest state of each row rather than every intermediate change; if it falls too
+# far behind it is told to resync instead.
+FEED_MODE = os.environ.get('FEED_MODE', 'auto')  # auto | changestream | poll
+FEED_POLL_SECONDS = float(os.environ.get('FEED_POLL_SECONDS', '2'))
+FEED_FLUSH_SECONDS = float(os.environ.get('FEED_FLUSH_SECONDS', '0.1'))
+FEED_MAX_PENDING = int(os.environ.get('FEED_MAX_PENDING', '500'))
+
+FEED_FIELDS = set(SUMMARY_PROJECTION) - {"_id"}
+STATS_FIELDS = {"review_status", "is_overdue"}
+
+class FeedSubscriber:
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self.pending = OrderedDict()  # application id -> merged changed fields
+        self.stats = None
+        self.resync = False
+        self.ready = asyncio.Event()
+
+    def push(self, app_id: str, fields: dict):
+        if self.resync:
+            return
+        if app_id in self.pending:
+            self.pending[app_id].update(fields)
+        elif len(self.pending) >= self.max_pending:
+            self.pending.clear()
+            self.resync = True
+        else:
+            self.pending[app_id] = dict(fields)
+        self.ready.set()
+
+    def push_stats(self, stats: dict):
+        self.stats = stats
+        self.ready.set()
+
+    def request_resync(self):
+        self.pending.clear()
+        self.resync = True
+        self.ready.set()
+
+    async def next_messages(self) -> List[dict]:
+        await self.ready.wait()
+        # Short window so a burst of writes goes out as one message
+        await asyncio.sleep(FEED_FLUSH_SECONDS)
+        self.ready.clear()
+        messages = []
+        if self.resync:
+            self.resync = False
+            messages.append({"type": "resync"})
+        elif self.pending:
+            messages.append({"type": "changes", "changes": [{"id": k, **v} for k, v in self.pending.items()]})
+            self.pending.clear()
+        if self.stats is not None:
+            messages.append({"type": "stats", "stats": self.stats})
+            self.stats = None
+        return messages
+
+class ApplicationFeed:
+    def __init__(self):
+        self.subscribers = set()
+        self.mode = None
+        self._watcher = None
+        self._stats_dirty = asyncio.Event()
+        self._stats_task = None
+
+    def subscribe(self) -> FeedSubscriber:
+        subscriber = FeedSubscriber(FEED_MAX_PENDING)
+        self.subscribers.add(subscriber)
+        if self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+            self._stats_task = asyncio.create_task(self._publish_stats())
+        return subscriber
+
+    def unsubscribe(self, subscriber: FeedSubscriber):
+        self.subscribers.discard(subscriber)
+
+    async def stop(self):
+        for task in (self._watcher, self._stats_task):
+            if task is not None:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._watcher = self._stats_task = None
+
+    def publish(self, app_id: str, fields: dict):
+        fields = {k: v for k, v in fields.items() if k in FEED_FIELDS and k != "id"}
+        if not fields:
+            return
+        for subscriber in self.subscribers:
+            subscriber.push(app_id, fields)
+        if STATS_FIELDS & fields.keys():
+            self._stats_dirty.set()
+
+    def publish_resync(self):
+        for subscriber in self.subscribers:
+            subscriber.request_resync()
+        self._stats_dirty.set()
+
+    async def _publish_stats(self):
+        """One stats aggregation per burst of changes, shared by all subscribers."""
+        while True:
+            await self._stats_dirty.wait()
+            await asyncio.sleep(FEED_FLUSH_SECONDS)
+            self._stats_dirty.clear()
+            try:
+                stats = await compute_stats()
+            except Exception as e:
+                logger.error(f"Feed stats refresh failed: {e}")
+                continue
+            for subscriber in self.subscribers:
+                subscriber.push_stats(stats)
+
+    async def _watch(self):
+        if FEED_MODE != "poll":
+            try:
+                await self._watch_change_stream()
+                return
+            except OperationFailure as e:
+                if FEED_MODE == "changestream":
+                    raise
+                logger.info(f"Change streams unavailable ({e}); polling for changes")
+        await self._poll()
+
+    async def _watch_change_stream(self):
+        self.mode = "changestream"
+        resume_token = None
+        while True:
+            try:
+                async with db.applications.watch(full_document="updateLookup", resume_after=resume_token) as stream:
+                    async for change in stream:
+                        resume_token = stream.resume_token
+                        self._on_change(change)
+            except OperationFailure as e:
+                if resume_token is None:
+                    raise  # not a replica set; let _watch fall back to polling
+                logger.error(f"Change stream interrupted, resuming: {e}")
+                await asyncio.sleep(1)
+            except PyMongoError as e:
+                logger.error(f"Change stream connection lost, resuming: {e}")
+                await asyncio.sleep(1)
+
+    def _on_change(self, change: dict):
+        op = change["operationType"]
+        doc = change.get("fullDocument") or {}
+        if op == "update" and doc.get("id"):
+            self.publish(doc["id"], change["updateDescription"]["updatedFields"])
+        elif op in ("insert", "replace") and doc.get("id"):
+            self.publish(doc["id"], doc)
+        else:
+            # Deletes and collection drops (e.g. reseeding) carry no application id
+            self.publish_resync()
+
+    async def _poll(self):
+        self.mode = "poll"
+        latest = await db.applications.find({}, {"_id": 0, "updated_at": 1, "id": 1}).sort(
+            [("updated_at", -1), ("id", -1)]
+        ).limit(1).to_list(1)
+        watermark = (latest[0]["updated_at"], latest[0]["id"]) if latest else ("", "")
+        while True:
+            await asyncio.sleep(FEED_POLL_SECONDS)
+            try:
+                last_updated, last_id = watermark
+                changed = await db.applications.find(
+                    {"$or": [{"updated_at": {"$gt": last_updated}}, {"updated_at": last_updated, "id": {"$gt": last_id}}]},
+                    SUMMARY_PROJECTION,
+                ).sort([("updated_at", 1), ("id", 1)]).limit(FEED_MAX_PENDING).to_list(FEED_MAX_PENDING)
+            except Exception as e:
+                logger.error(f"Feed poll failed: {e}")
+                continue
+            for doc in changed:
+                self.publish(doc["id"], doc)
+            if changed:
+                watermark = (changed[-1]["updated_at"], changed[-1]["id"])
+
+application_feed = ApplicationFeed()
+
+# ---------- HTTP Caching ----------
+# Application reads carry weak ETags (the body may be sent gzip- or brotli-encoded, so
+# they promise equivalent content, not identical bytes) and `Cache-Control: private, no-cache`, so clients
+# revalidate every time and get a bodiless 304 when nothing changed. Detail ETags come
+# from the document's version/updated_at; list ETags from a collection version counter
+# that every write path bumps *after* its write lands (bumping first could pin a stale
+# page under the new tag). A second counter, content_version, skips review-status writes;
+# it keys caches of fields review decisions never touch (portfolio analytics). List pages
+# also carry rollup stats, so their ETags include rollup_generation, bumped whenever the
+# rollups are rebuilt or repaired without any application write.
+CACHE_CONTROL = "private, no-cache"
+
+async def bump_applications_version(content: bool = True, reseed: bool = False):
+    inc = {"version": 1, "content_version": 1} if content else {"version": 1}
+    if reseed:
+        inc["seed_generation"] = 1  # other workers' caches clear themselves on their next sync
+    await db.meta.update_one({"_id": "applications"}, {"$inc": inc}, upsert=True)
+
+async def bump_rollup_generation():
+    await db.meta.update_one({"_id": "applications"}, {"$inc": {"rollup_generation": 1}}, upsert=True)
+
+async def applications_meta() -> dict:
+    """The shared counters: version, content_version, seed_generation, rollup_generation."""
+    return await db.meta.find_one({"_id": "applications"}) or {}
+
+async def applications_version() -> int:
+    return (await applications_meta()).get("version", 0)
+
+async def applications_content_version() -> int:
+    return (await applications_meta()).get("content_version", 0)
+
+def make_etag(*parts) -> str:
+    return 'W/"' + hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:20] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    # Weak comparison, as RFC 9110 requires for If-None-Match
+    candidates = [c.strip().removeprefix("W/") for c in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL})
+
+try:
+    from brotli_asgi import BrotliMiddleware
+except ImportError:
+    BrotliMiddleware = None
+
+class CompressionMiddleware:
+    """Brotli when brotli-asgi is installed (it falls back to gzip for clients without br),
+    gzip otherwise. Event streams pass through untouched: compressors buffer, which would
+    hold back streamed tokens."""
+
+    def __init__(self, app, minimum_size: int = 1024):
+        self.app = app
+        if BrotliMiddleware is not None:
+            self.compressed = BrotliMiddleware(app, minimum_size=minimum_size)
+        else:
+            self.compressed = GZipMiddleware(app, minimum_size=minimum_size)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await self.compressed(scope, receive, send)
+
+# ---------- Application Cache ----------
+# Read-through LRU of whole application documents for the detail route and chat, bounded
+# by encoded size. Every write path in this process evicts the ids it touched. Writes
+# made by other workers are picked up by `sync`: when the shared applications version
+# moves, ids whose updated_at is newer than the last sync (less a clock-skew margin) are
+# evicted, so another worker's write is visible here within APP_CACHE_SYNC_SECONDS; a
+# reseed anywhere empties the cache. APP_CACHE_MAX_MB=0 turns the cache off.
+APP_CACHE_MAX_BYTES = int(float(os.environ.get('APP_CACHE_MAX_MB', '64')) * 2 ** 20)
+APP_CACHE_SYNC_SECONDS = float(os.environ.get('APP_CACHE_SYNC_SECONDS', '1'))
+APP_CACHE_SYNC_SKEW_SECONDS = 5
+APP_CACHE_SYNC_LIMIT = 1000
+APP_CACHE_PROJECTION = {"_id": 0, "search_terms": 0}
+
+def project_document(doc: Optional[dict], projection: Optional[dict]) -> Optional[dict]:
+    """Apply a top-level inclusion projection (like CHAT_APPLICATION_PROJECTION) to a loaded document."""
+    fields = [field for field, include in (projection or {}).items() if include and field != "_id"]
+    if doc is None or not fields:
+        return doc
+    return {field: doc[field] for field in fields if field in doc}
+
+class ApplicationCache:
+    """Documents are shared between callers and must not be mutated."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # id -> (doc, size)
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        # Bumped by every invalidation, so a read that raced a write is not cached
+        self._generation = 0
+        self._synced_version = None
+        self._synced_seed = None
+        self._synced_since = self._sync_watermark()
+
+    async def get(self, application_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        """The document, narrowed to `projection`; the whole document is what gets cached."""
+        entry = self._entries.get(application_id)
+        if entry is not None:
+            self._entries.move_to_end(application_id)
+            self.hits += 1
+            return project_document(entry[0], projection)
+        self.misses += 1
+        generation = self._generation
+        doc = await db.applications.find_one({"id": application_id}, APP_CACHE_PROJECTION)
+        if doc is not None and generation == self._generation:
+            self._put(application_id, doc)
+        return project_document(doc, projection)
+
+    def invalidate(self, application_ids: List[str]):
+        self._generation += 1
+        for application_id in application_ids:
+            entry = self._entries.pop(application_id, None)
+            if entry is not None:
+                self.bytes -= entry[1]
+                self.invalidations += 1
+
+    def clear(self):
+        self._generation += 1
+        self.invalidations += len(self._entries)
+        self._entries.clear()
+        self.bytes = 0
+
+    async def sync(self):
+        """Evict entries changed by other workers since the last sync.
+
+        Deletions leave nothing to find by updated_at, so a reseed (which deletes every
+        document) bumps seed_generation and empties the cache instead.
+        """
+        meta = await applications_meta()
+        version = meta.get("version", 0)
+        if version == self._synced_version:
+            return
+        watermark = self._sync_watermark()
+        seed = meta.get("seed_generation", 0)
+        if seed != self._synced_seed:
+            self.clear()
+            self._synced_seed = seed
+        elif self._entries:
+            changed = await db.applications.find(
+                {"updated_at": {"$gte": self._synced_since}}, {"_id": 0, "id": 1, "updated_at": 1}
+            ).limit(APP_CACHE_SYNC_LIMIT).to_list(APP_CACHE_SYNC_LIMIT)
+            if len(changed) == APP_CACHE_SYNC_LIMIT:
+                self.clear()
+            else:
+                stale = [d["id"] for d in changed
+                         if d["id"] in self._entries and self._entries[d["id"]][0].get("updated_at") != d.get("updated_at")]
+                self.invalidate(stale)
+        else:
+            # Nothing cached to check, but a fill may be racing the write we just saw
+            self._generation += 1
+        self._synced_version = version
+        self._synced_since = watermark
+
+    @staticmethod
+    def _sync_watermark() -> str:
+        return (datetime.now(timezone.utc) - timedelta(seconds=APP_CACHE_SYNC_SKEW_SECONDS)).isoformat()
+
+    def metrics(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+    def _put(self, application_id: str, doc: dict):
+        size = len(bson.encode(doc))
+        if size > self.max_bytes:
+            return
+        previous = self._entries.pop(application_id, None)
+        if previous is not None:
+            self.bytes -= previous[1]
+        self._entries[application_id] = (doc, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+
+class UncachedApplications:
+    """Stand-in when APP_CACHE_MAX_MB=0: same interface, always reads Mongo."""
+    hits = misses = 0
+
+    async def get(self, application_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await db.applications.find_one({"id": application_id}, projection or APP_CACHE_PROJECTION)
+
+    def invalidate(self, application_ids: List[str]):
+        pass
+
+    def clear(self):
+        pass
+
+    async def sync(self):
+        pass
+
+    def metrics(self) -> dict:
+        return {"entries": 0, "bytes": 0, "max_bytes": 0}
+
+application_cache = ApplicationCache(APP_CACHE_MAX_BYTES) if APP_CACHE_MAX_BYTES > 0 else UncachedApplications()
+
+async def application_cache_sync():
+    while True:
+        await asyncio.sleep(APP_CACHE_SYNC_SECONDS)
+        try:
+            await application_cache.sync()
+        except Exception as e:
+            logger.error(f"Application cache sync failed: {e}")
+
+# ---------- Import ----------
+# POST /api/applications:import reads NDJSON or CSV straight off the request stream, so
+# memory is bounded by one batch however large the upload. Each record is validated
+# against LoanApplicationImport and upserted by application_no; derived fields, rollups,
+# versions and the answer cache are maintained exactly as for any other write.
+IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', '500'))
+IMPORT_MAX_LINE_BYTES = 1 << 20
+IMPORT_MAX_ERRORS_PER_BATCH = 20
+IMPORT_MAX_REPORTED_BATCHES = 100
+# Owned by the server; ignored if present in the upload
+IMPORT_SERVER_FIELDS = ("id", "version", "created_at", "updated_at")
+# CSV cells holding JSON for the nested parts of the schema
+IMPORT_JSON_FIELDS = (
+    "ai_recommendation", "company_insights", "key_ratios", "covenant_recommendations",
+    "documents", "financial_analysis", "macro_analysis",
+)
+
+class ImportAborted(Exception):
+    pass
+
+async def iter_body_lines(stream):
+    """(line number, bytes) for each line of a streamed body."""
+    buffer = b""
+    line_no = 0
+    async for chunk in stream:
+        buffer += chunk
+        if b"\n" not in buffer:
+            if len(buffer) > IMPORT_MAX_LINE_BYTES:
+                raise ImportAborted(f"Line {line_no + 1} is longer than {IMPORT_MAX_LINE_BYTES} bytes")
+            continue
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line
+    if buffer:
+        yield line_no + 1, buffer
+
+async def iter_import_records(lines, fmt: str):
+    """(line number, record, error) per record; record is None when the row can't be parsed."""
+    if fmt == "ndjson":
+        async for line_no, raw in lines:
+            if not raw.strip():
+                continue
+            try:
+                record = json.loads(raw)
+            except ValueError as e:
+                yield line_no, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "Expected a JSON object"
+                continue
+            yield line_no, record, None
+        return
+
+    header, pending, start = None, "", None
+    async for line_no, raw in lines:
+        text = raw.decode("utf-8", errors="replace").rstrip("\r")
+        if not pending and not text.strip():
+            continue
+        pending = f"{pending}\n{text}" if pending else text
+        start = start or line_no
+        if pending.count('"') % 2:
+            # A quoted field continues on the next line
+            continue
+        row = next(csv.reader([pending]))
+        record_line, pending, start = start, "", None
+        if header is None:
+            header = [column.strip().lstrip("\ufeff") for column in row]
+            continue
+        if len(row) != len(header):
+            yield record_line, None, f"Expected {len(header)} columns, got {len(row)}"
+            continue
+        record, error = {}, None
+        for column, cell in zip(header, row):
+            if cell == "":
+                continue
+            if column in IMPORT_JSON_FIELDS:
+                try:
+                    cell = json.loads(cell)
+                except ValueError:
+                    error = f"Column {column} is not valid JSON"
+                    break
+            record[column] = cell
+        yield record_line, (None if error else record), error
+    if pending:
+        yield start, None, "Unterminated quoted field"
+
+def validation_message(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(p) for p in err['loc']) or 'record'}: {err['msg']}" for err in e.errors()[:3]
+    )
+
+async def upsert_import_batch(records: List[tuple]) -> dict:
+    """Upsert validated (line number, document) pairs by application_no in one bulk_write."""
+    # Within a batch the last row for an application_no wins
+    by_no = {}
+    for line_no, doc in records:
+        by_no[doc["application_no"]] = (line_no, doc)
+    existing = {
+        a["application_no"]: a async for a in db.applications.find(
+            {"application_no": {"$in": list(by_no)}}, APPLICATION_PROJECTION
+        )
+    }
+
+    now = datetime.now(timezone.utc).isoformat()
+    ops, planned = [], []
+    for no, (line_no, doc) in by_no.items():
+        old = existing.get(no)
+        fields = {k: v for k, v in doc.items() if k not in IMPORT_SERVER_FIELDS}
+        merged = {**(old or {}), **fields}
+        fields.update(derived_fields(merged))
+        fields["updated_at"] = now
+        ops.append(UpdateOne(
+            {"application_no": no},
+            {"$set": fields, "$inc": {"version": 1},
+             "$setOnInsert": {"id": str(uuid.uuid4()), "created_at": now}},
+            upsert=True,
+        ))
+        planned.append((line_no, old, merged))
+
+    failed = {}
+    try:
+        await db.applications.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        failed = {err["index"]: err.get("errmsg", "write failed") for err in e.details.get("writeErrors", [])}
+    except PyMongoError as e:
+        failed = {index: f"Batch write failed: {e}" for index in range(len(ops))}
+
+    result = {"inserted": 0, "updated": 0, "superseded": len(records) - len(by_no), "errors": []}
+    deltas, updated_ids = {}, []
+    for index, (line_no, old, merged) in enumerate(planned):
+        if index in failed:
+            result["errors"].append({"line": line_no, "application_no": merged["application_no"], "error": failed[index]})
+            continue
+        rollup_deltas(old, merged, deltas)
+        if old:
+            result["updated"] += 1
+            updated_ids.append(old["id"])
+        else:
+            result["inserted"] += 1
+    if result["inserted"] or result["updated"]:
+        await apply_rollup_deltas(deltas)
+        application_cache.invalidate(updated_ids)
+        await bump_applications_version()
+        await answer_cache.invalidate_applications(updated_ids)
+    return result
+
+class ApplicationImport:
+    """Accumulates one upload's records into batches and keeps a bounded report."""
+
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.totals = {"received": 0, "inserted": 0, "updated": 0, "superseded": 0, "failed": 0}
+        self.batches = 0
+        self.reported = []
+        self.truncated = False
+        self._valid, self._errors, self._first_line, self._last_line = [], [], None, None
+
+    async def add(self, line_no: int, record: Optional[dict], error: Optional[str]):
+        if record is not None:
+            try:
+                doc = LoanApplicationImport.model_validate(record).model_dump(exclude_unset=True)
+                self._valid.append((line_no, doc))
+            except ValidationError as e:
+                error = validation_message(e)
+        if error:
+            self._errors.append({"line": line_no, "application_no": (record or {}).get("application_no"), "error": error})
+        self._first_line = self._first_line or line_no
+        self._last_line = line_no
+        self.totals["received"] += 1
+        if len(self._valid) + len(self._errors) >= self.batch_size:
+            await self.flush()
+
+    async def flush(self):
+        if not self._valid and not self._errors:
+            return
+        self.batches += 1
+        result = await upsert_import_batch(self._valid) if self._valid else {
+            "inserted": 0, "updated": 0, "superseded": 0, "errors": []
+        }
+        errors = self._errors + result["errors"]
+        for key in ("inserted", "updated", "superseded"):
+            self.totals[key] += result[key]
+        self.totals["failed"] += len(errors)
+        if errors:
+            if len(self.reported) < IMPORT_MAX_REPORTED_BATCHES:
+                self.reported.append({
+                    "batch": self.batches, "first_line": self._first_line, "last_line": self._last_line,
+                    "inserted": result["inserted"], "updated": result["updated"], "failed": len(errors),
+                    "errors": errors[:IMPORT_MAX_ERRORS_PER_BATCH],
+                })
+            else:
+                self.truncated = True
+        logger.info(f"Import batch {self.batches}: {result['inserted']} inserted, {result['updated']} updated, {len(errors)} failed")
+        self._valid, self._errors, self._first_line, self._last_line = [], [], None, None
+
+    def report(self, status: str, detail: Optional[str] = None) -> dict:
+        report = {"status": status, **self.totals, "batches": self.batches,
+                  "failed_batches": self.reported, "failed_batches_truncated": self.truncated}
+        if detail:
+            report["detail"] = detail
+        return report
+
+# ---------- Portfolio Analytics ----------
+# Cross-application risk metrics. The ratio series of every application are loaded into
+# columnar arrays (one row per application, the last ANALYTICS_SERIES_POINTS fiscal years
+# right-aligned, NaN where missing) and everything below is computed over whole columns.
+# A build is cached against the applications collection version, so dashboards only pay
+# for it once per write.
+ANALYTICS_SERIES_POINTS = 3
+ANALYTICS_METRICS = ("interest_coverage", "debt_to_equity", "revenue", "operating_margin")
+PORTERS_FORCES = ("buyer_power", "supplier_power", "threat_new_entrants", "threat_substitutes", "competitive_rivalry")
+# Mongo flattens each series to a plain array of numbers, so Python never walks the documents
+ANALYTICS_PROJECTION = {
+    "_id": 0, "id": 1, "application_no": 1, "applicant_name": 1, "industry": 1, "loan_amount": 1,
+    "interest_coverage": "$key_ratios.interest_coverage.value",
+    "debt_to_equity": "$key_ratios.debt_to_equity.value",
+    "revenue": "$financial_analysis.financials.amount",
+    "operating_margin": "$financial_analysis.financials.operating_margin",
+    "porters": [f"$macro_analysis.porters_forces.{force}.score" for force in PORTERS_FORCES],
+}
+
+# Outlier rules
+ICR_DETERIORATION = 0.25   # interest coverage down 25%+ across the window
+ICR_FLOOR = 2.0            # or below 2.0x at the latest year
+MARGIN_COMPRESSION = 5.0   # operating margin down 5+ points across the window
+LEVERAGE_ROBUST_Z = 3.0    # latest D/E this many MADs above the portfolio median
+OUTLIER_RULES = ("deteriorating_icr", "margin_compression", "high_leverage")
+
+def as_number(value) -> float:
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+
+def series_matrix(rows: list, points: int) -> "np.ndarray":
+    matrix = np.full((len(rows), points), np.nan)
+    for i, values in enumerate(rows):
+        tail = values[-points:] if isinstance(values, list) else []
+        if tail:
+            matrix[i, points - len(tail):] = [as_number(v) for v in tail]
+    return matrix
+
+def first_last(matrix: "np.ndarray"):
+    """First and last non-NaN value of each row (NaN for empty rows)."""
+    rows = np.arange(len(matrix))
+    present = ~np.isnan(matrix)
+    first = matrix[rows, np.argmax(present, axis=1)]
+    last = matrix[rows, matrix.shape[1] - 1 - np.argmax(present[:, ::-1], axis=1)]
+    return first, last
+
+def trend_slopes(matrix: "np.ndarray") -> "np.ndarray":
+    """Least-squares slope per row, per fiscal year; NaN with fewer than two points."""
+    present = ~np.isnan(matrix)
+    n = present.sum(axis=1)
+    x = np.broadcast_to(np.arange(matrix.shape[1], dtype=float), matrix.shape)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x_mean = np.where(present, x, 0).sum(axis=1) / n
+        y_mean = np.nansum(matrix, axis=1) / n
+        dx = np.where(present, x - x_mean[:, None], 0)
+        dy = np.where(present, matrix - y_mean[:, None], 0)
+        slope = (dx * dy).sum(axis=1) / (dx * dx).sum(axis=1)
+    return np.where(n >= 2, slope, np.nan)
+
+def percentile_ranks(values: "np.ndarray") -> "np.ndarray":
+    """Percentile of each value within the column (0 = lowest, 100 = highest, ties averaged)."""
+    ranks = np.full(len(values), np.nan)
+    present = ~np.isnan(values)
+    count = int(present.sum())
+    if count == 1:
+        ranks[present] = 100.0
+    elif count > 1:
+        ordered = np.sort(values[present])
+        below = np.searchsorted(ordered, values[present], side="left")
+        upto = np.searchsorted(ordered, values[present], side="right")
+        ranks[present] = (below + upto - 1) / 2 / (count - 1) * 100
+    return ranks
+
+def group_means(codes: "np.ndarray", values: "np.ndarray", groups: int) -> "np.ndarray":
+    present = ~np.isnan(values)
+    totals = np.bincount(codes[present], weights=values[present], minlength=groups)
+    counts = np.bincount(codes[present], minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, totals / counts, np.nan)
+
+def group_medians(codes: "np.ndarray", values: "np.ndarray", groups: int) -> "np.ndarray":
+    present = ~np.isnan(values)
+    codes, values = codes[present], values[present]
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    counts = np.bincount(codes, minlength=groups)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    medians = np.full(groups, np.nan)
+    has = counts > 0
+    lower = starts[has] + (counts[has] - 1) // 2
+    upper = starts[has] + counts[has] // 2
+    medians[has] = (values[lower] + values[upper]) / 2
+    return medians
+
+def to_number(value) -> Optional[float]:
+    """JSON-safe float: NaN/inf become null."""
+    value = float(value)
+    return round(value, 4) if np.isfinite(value) else None
+
+class PortfolioAnalytics:
+    """One columnar snapshot of the portfolio and the metrics derived from it."""
+
+    def __init__(self, docs: List[dict], version: int):
+        self.version = version
+        self.computed_at = datetime.now(timezone.utc).isoformat()
+        self.ids = [d["id"] for d in docs]
+        self.application_nos = [d.get("application_no") for d in docs]
+        self.names = [d.get("applicant_name") for d in docs]
+        self.industry_names, self.industry_codes = np.unique(
+            np.array([d.get("industry") or "Unknown" for d in docs], dtype=object).astype(str), return_inverse=True
+        )
+        self.loan_amount = np.array([as_number(d.get("loan_amount")) for d in docs], dtype=float)
+
+        self.first, self.latest, self.trend, self.percentile = {}, {}, {}, {}
+        for metric in ANALYTICS_METRICS:
+            matrix = series_matrix([d.get(metric) for d in docs], ANALYTICS_SERIES_POINTS)
+            self.first[metric], self.latest[metric] = first_last(matrix)
+            self.trend[metric] = trend_slopes(matrix)
+            self.percentile[metric] = percentile_ranks(self.latest[metric])
+
+        porters = series_matrix([d.get("porters") for d in docs], len(PORTERS_FORCES))
+        scored = (~np.isnan(porters)).sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.porters_pressure = np.where(scored > 0, np.nansum(porters, axis=1) / scored, np.nan)
+
+        self.flags = self._outlier_flags()
+
+    def _outlier_flags(self) -> dict:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            icr_first, icr_latest = self.first["interest_coverage"], self.latest["interest_coverage"]
+            icr_change = (icr_latest - icr_first) / np.abs(icr_first)
+            deteriorating_icr = (self.trend["interest_coverage"] < 0) & (
+                (icr_change <= -ICR_DETERIORATION) | (icr_latest < ICR_FLOOR)
+            )
+            margin_drop = self.first["operating_margin"] - self.latest["operating_margin"]
+            margin_compression = (self.trend["operating_margin"] < 0) & (margin_drop >= MARGIN_COMPRESSION)
+            leverage = self.latest["debt_to_equity"]
+            median = np.nanmedian(leverage) if (~np.isnan(leverage)).any() else np.nan
+            mad = np.nanmedian(np.abs(leverage - median)) * 1.4826 if np.isfinite(median) else np.nan
+            high_leverage = (leverage - median) / mad > LEVERAGE_ROBUST_Z if mad and np.isfinite(mad) else np.zeros(len(leverage), bool)
+        return {
+            "deteriorating_icr": deteriorating_icr,
+            "margin_compression": margin_compression,
+            "high_leverage": high_leverage,
+        }
+
+    def _metric_distribution(self, values: "np.ndarray") -> dict:
+        present = values[~np.isnan(values)]
+        if not len(present):
+            return {"count": 0, "p10": None, "p50": None, "p90": None, "mean": None}
+        p10, p50, p90 = np.percentile(present, [10, 50, 90])
+        return {"count": int(len(present)), "p10": to_number(p10), "p50": to_number(p50),
+                "p90": to_number(p90), "mean": to_number(present.mean())}
+
+    def _application_row(self, i: int) -> dict:
+        return {"id": self.ids[i], "application_no": self.application_nos[i], "applicant_name": self.names[i],
+                "industry": str(self.industry_names[self.industry_codes[i]])}
+
+    def summary(self) -> dict:
+        return {
+            "applications": len(self.ids),
+            "total_loan_amount": to_number(np.nansum(self.loan_amount)),
+            "latest": {m: self._metric_distribution(self.latest[m]) for m in ANALYTICS_METRICS},
+            "declining_trend": {m: int((self.trend[m] < 0).sum()) for m in ANALYTICS_METRICS},
+            "porters_pressure": self._metric_distribution(self.porters_pressure),
+            "outliers": {rule: int(flags.sum()) for rule, flags in self.flags.items()},
+        }
+
+    def industries(self) -> List[dict]:
+        groups = len(self.industry_names)
+        codes = self.industry_codes
+        counts = np.bincount(codes, minlength=groups)
+        loans = np.bincount(codes, weights=np.nan_to_num(self.loan_amount), minlength=groups)
+        medians = {m: group_medians(codes, self.latest[m], groups) for m in ANALYTICS_METRICS}
+        trends = {m: group_means(codes, self.trend[m], groups) for m in ANALYTICS_METRICS}
+        pressure = group_means(codes, self.porters_pressure, groups)
+        flagged = {rule: np.bincount(codes, weights=flags.astype(float), minlength=groups) for rule, flags in self.flags.items()}
+        rows = []
+        for g in np.argsort(-loans):
+            rows.append({
+                "industry": str(self.industry_names[g]),
+                "applications": int(counts[g]),
+                "total_loan_amount": to_number(loans[g]),
+                "median_latest": {m: to_number(medians[m][g]) for m in ANALYTICS_METRICS},
+                "mean_trend": {m: to_number(trends[m][g]) for m in ANALYTICS_METRICS},
+                "porters_pressure": to_number(pressure[g]),
+                "outliers": {rule: int(flagged[rule][g]) for rule in self.flags},
+            })
+        return rows
+
+    def rankings(self, metric: str, order: str, limit: int) -> List[dict]:
+        values = self.latest[metric]
+        present = np.flatnonzero(~np.isnan(values))
+        ordered = present[np.argsort(values[present], kind="stable")]
+        if order == "desc":
+            ordered = ordered[::-1]
+        return [
+            {**self._application_row(i), "latest": to_number(values[i]), "trend": to_number(self.trend[metric][i]),
+             "percentile": to_number(self.percentile[metric][i])}
+            for i in ordered[:limit]
+        ]
+
+    def outliers(self, rules: List[str], limit: int) -> List[dict]:
+        hits = np.zeros(len(self.ids), bool)
+        for rule in rules:
+            hits |= self.flags[rule]
+        rows = []
+        # Worst interest-coverage trend first
+        indices = np.flatnonzero(hits)
+        indices = indices[np.argsort(np.nan_to_num(self.trend["interest_coverage"][indices], nan=np.inf), kind="stable")]
+        for i in indices[:limit]:
+            rows.append({
+                **self._application_row(i),
+                "rules": [rule for rule in rules if self.flags[rule][i]],
+                "latest": {m: to_number(self.latest[m][i]) for m in ANALYTICS_METRICS},
+                "trend": {m: to_number(self.trend[m][i]) for m in ANALYTICS_METRICS},
+            })
+        return rows
+
+class PortfolioAnalyticsCache:
+    """Latest PortfolioAnalytics build, rebuilt when the collection's content version moves on.
+
+    Keyed on content_version, so review-status updates (not in ANALYTICS_PROJECTION) do
+    not force a rebuild.
+    """
+
+    def __init__(self):
+        self._portfolio = None
+        self._lock = asyncio.Lock()
+        self.builds = 0
+
+    async def get(self) -> PortfolioAnalytics:
+        version = await applications_content_version()
+        if self._portfolio is not None and self._portfolio.version == version:
+            return self._portfolio
+        async with self._lock:
+            # Concurrent requests for a stale snapshot share one rebuild
+            if self._portfolio is None or self._portfolio.version != version:
+                start = time.perf_counter()
+                docs = await db.applications.aggregate(
+                    [{"$project": ANALYTICS_PROJECTION}], batchSize=5000
+                ).to_list(None)
+                # Version read before loading: a write during the load only makes the next request rebuild
+                self._portfolio = await asyncio.to_thread(PortfolioAnalytics, docs, version)
+                self.builds += 1
+                logger.info(f"Portfolio analytics for {len(docs)} applications built in {(time.perf_counter() - start) * 1000:.1f} ms")
+            return self._portfolio
+
+portfolio_analytics = PortfolioAnalyticsCache()
+
+# ---------- Indexes ----------
+# collection -> [(keys, options)]. create_index is a no-op when the index already exists,
+# so this runs on every startup.
+INDEXES = {
+    "applications": [
+        ("id", {"unique": True}),
+        ("application_no", {"unique": True}),
+        # Keyset pagination: one (sort field, id) index per sortable column
+        ([("application_no", 1), ("id", 1)], {}),
+        ([("loan_amount", 1), ("id", 1)], {}),
+        ([("updated_at", 1), ("id", 1)], {}),
+        ("search_terms", {}),
+        (SEARCH_TEXT_INDEX, {"weights": SEARCH_TEXT_WEIGHTS, "name": "application_search_text"}),
+    ],
+    "chat_messages": [
+        ("id", {"unique": True}),
+        # History lookup on every /api/chat turn, and keyset paging of the history endpoint
+        ([("session_id", 1), ("timestamp", 1), ("id", 1)], {}),
+    ],
+    "chat_sessions": [
+        ("session_id", {"unique": True}),
+    ],
+    "jobs": [
+        ("id", {"unique": True}),
+        ("idempotency_key", {"unique": True}),
+        # claim_job: queued jobs by priority then age, and expired leases
+        ([("status", 1), ("priority", -1), ("created_at", 1)], {}),
+        ([("status", 1), ("lease_expires_at", 1)], {}),
+        ("application_id", {}),
+    ],
+    "rollups": [
+        ("dimension", {}),
+    ],
+    # Only used with CHAT_CACHE_BACKEND=mongo
+    "chat_answer_cache": [
+        ("expires_at", {"expireAfterSeconds": 0}),
+        ("application_id", {}),
+        ("last_hit_at", {}),
+    ],
+}
+
+# Indexes that earlier versions created and nothing reads any more; dropped on startup so
+# they stop adding write cost. compute_stats now reads rollups, not applications.
+OBSOLETE_INDEXES = {
+    "applications": ["review_status_1_is_overdue_1"],
+}
+
 # ---------- Routes ----------
 @api_router.get("/")
 async def root():
@@ -466,157 +3300,579 @@ async def seed_database():
     if existing > 0:
         await db.applications.delete_many({})
     apps = get_seed_applications()
+    for a in apps:
+        a.update(derived_fields(a))
+        a["version"] = 1
     await db.applications.insert_many(apps)
+    await rebuild_rollups()
+    application_cache.clear()
+    await bump_applications_version(reseed=True)
+    await answer_cache.clear()
     return {"message": f"Seeded {len(apps)} applications", "count": len(apps)}
 
-@api_router.get("/applications")
-async def get_applications(search: Optional[str] = None):
+@api_router.get("/applications", response_model=ApplicationsPage)
+async def get_applications(
+    request: Request,
+    search: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    sort: Literal["application_no", "loan_amount", "updated_at"] = "application_no",
+    order: Literal["asc", "desc"] = "asc",
+    view: Literal["summary", "full"] = "summary",
+    search_mode: Literal["prefix", "text"] = "prefix",
+):
+    meta = await applications_meta()
+    etag = make_etag(meta.get("version", 0), meta.get("rollup_generation", 0), sorted(request.query_params.multi_items()))
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+
+    projection = SUMMARY_PROJECTION if view == "summary" else APPLICATION_PROJECTION
+    if search and search_mode == "text":
+        # Relevance-ranked: returns the top `limit` matches, no cursor
+        apps = await db.applications.find(
+            {"$text": {"$search": search}},
+            {**projection, "score": {"$meta": "textScore"}},
+        ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list(limit)
+        for a in apps:
+            a.pop("score", None)
+        stats = await compute_stats()
+        return json_response({"applications": apps, "stats": stats, "next_cursor": None, "has_more": False}, headers)
+
     query = {}
     if search:
-        query = {"$or": [
-            {"applicant_name": {"$regex": search, "$options": "i"}},
-            {"application_no": {"$regex": search, "$options": "i"}},
-            {"industry": {"$regex": search, "$options": "i"}}
-        ]}
-    apps = await db.applications.find(query, {"_id": 0}).to_list(100)
-
-    # Compute stats
-    all_apps = await db.applications.find({}, {"_id": 0, "review_status": 1, "is_overdue": 1}).to_list(1000)
-    pending = [a for a in all_apps if a.get("review_status") == "Review Pending"]
-    awaiting = [a for a in all_apps if a.get("review_status") == "Awaiting Instructions"]
-    completed = [a for a in all_apps if a.get("review_status") in ["Approved", "Rejected"]]
-
-    stats = {
-        "pending": {"count": len(pending), "overdue": sum(1 for a in pending if a.get("is_overdue"))},
-        "awaiting": {"count": len(awaiting), "overdue": sum(1 for a in awaiting if a.get("is_overdue"))},
-        "completed": {"count": len(completed), "overdue": sum(1 for a in completed if a.get("is_overdue"))}
+        tokens = search_tokens(search)
+        if not tokens:
+            stats = await compute_stats()
+            return json_response({"applications": [], "stats": stats, "next_cursor": None, "has_more": False}, headers)
+        query = prefix_search_query(tokens)
+    direction = 1 if order == "asc" else -1
+    if cursor:
+        after = keyset_after(sort, *decode_cursor(cursor), direction)
+        query = {"$and": [query, after]} if query else after
+
+    apps = await db.applications.find(query, projection).sort(
+        [(sort, direction), ("id", direction)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    has_more = len(apps) > limit
+    apps = apps[:limit]
+    next_cursor = encode_cursor(apps[-1].get(sort), apps[-1]["id"]) if has_more else None
+
+    stats = await compute_stats()
+    return json_response({"applications": apps, "stats": stats, "next_cursor": next_cursor, "has_more": has_more}, headers)
+
+@api_router.post("/applications:import")
+async def import_applications(
+    request: Request,
+    format: Optional[Literal["ndjson", "csv"]] = None,
+    batch_size: int = Query(IMPORT_BATCH_SIZE, ge=1, le=5000),
+):
+    """Stream-import applications from an NDJSON or CSV body, upserting by application_no.
+
+    The format comes from `format` or the Content-Type (text/csv, else NDJSON). CSV takes
+    a header row; nested fields (key_ratios, financial_analysis, ...) are JSON in their
+    cells. Batches are committed as they fill, so rows before a failure stay imported; the
+    report lists batches with failed rows, by line number.
+    """
+    fmt = format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")
+    run = ApplicationImport(batch_size)
+    try:
+        async for line_no, record, error in iter_import_records(iter_body_lines(request.stream()), fmt):
+            await run.add(line_no, record, error)
+        await run.flush()
+    except ImportAborted as e:
+        await run.flush()
+        return run.report("aborted", str(e))
+    return run.report("completed")
+
+@api_router.put("/applications/review-status:bulk")
+async def bulk_update_review_status(body: BulkReviewStatusUpdate):
+    """Apply many review-status changes with one read and one bulk_write.
+
+    Every write is conditioned on the version read just before, so a concurrent change
+    to the same application surfaces as a per-item `conflict` rather than being
+    overwritten. Rollups are adjusted in one bulk_write for the whole batch.
+    """
+    ids = [item.id for item in body.updates]
+    current = {
+        a["id"]: a async for a in db.applications.find(
+            {"id": {"$in": ids}}, {**ROLLUP_PROJECTION, "id": 1, "version": 1}
+        )
+    }
+
+    now = datetime.now(timezone.utc).isoformat()
+    results, ops, planned, seen = [], [], [], set()
+    for item in body.updates:
+        doc = current.get(item.id)
+        if item.id in seen:
+            results.append({"id": item.id, "status": "duplicate"})
+            continue
+        seen.add(item.id)
+        if doc is None:
+            results.append({"id": item.id, "status": "not_found"})
+            continue
+        version = doc.get("version")
+        if item.expected_version is not None and item.expected_version != (version or 0):
+            results.append({"id": item.id, "status": "conflict", "version": version or 0})
+            continue
+        ops.append(UpdateOne(
+            {"id": item.id, "version": version},
+            {"$set": {"review_status": item.review_status, "updated_at": now}, "$inc": {"version": 1}},
+        ))
+        result = {"id": item.id, "status": "updated", "review_status": item.review_status, "version": (version or 0) + 1}
+        results.append(result)
+        planned.append((result, doc))
+
+    if ops:
+        write = await db.applications.bulk_write(ops, ordered=False)
+        if write.matched_count < len(ops):
+            # Some version checks lost a race; find out which
+            after = {
+                a["id"]: a async for a in db.applications.find(
+                    {"id": {"$in": [r["id"] for r, _ in planned]}}, {"_id": 0, "id": 1, "version": 1, "updated_at": 1}
+                )
+            }
+            for result, _ in planned:
+                doc = after.get(result["id"], {})
+                if doc.get("version") != result["version"] or doc.get("updated_at") != now:
+                    result.update(status="conflict", version=doc.get("version", 0))
+                    result.pop("review_status", None)
+
+    updated = [(r, doc) for r, doc in planned if r["status"] == "updated"]
+    if updated:
+        deltas = {}
+        for result, doc in updated:
+            rollup_deltas(doc, {**doc, "review_status": result["review_status"]}, deltas)
+        await apply_rollup_deltas(deltas)
+        application_cache.invalidate([r["id"] for r, _ in updated])
+        await bump_applications_version(content=False)
+    await answer_cache.invalidate_applications([r["id"] for r, _ in updated])
+    return {
+        "results": results,
+        "updated": len(updated),
+        "updated_at": now,
+        "stats": await compute_stats(),
     }
-    return {"applications": apps, "stats": stats}
 
-@api_router.get("/applications/{application_id}")
-async def get_application(application_id: str):
-    app = await db.applications.find_one({"id": application_id}, {"_id": 0})
+@api_router.get("/applications/changes")
+async def get_application_changes(
+    since: Optional[str] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+):
+    """Applications updated after a watermark, oldest change first, in the summary view.
+
+    Pass `since` (an updated_at timestamp) on the first call and the returned `cursor`
+    afterwards; stats are included so clients can resync the status cards.
+    """
+    query = {}
+    if cursor:
+        query = keyset_after("updated_at", *decode_cursor(cursor), 1)
+    elif since:
+        query = {"updated_at": {"$gt": since}}
+    changes = await db.applications.find(query, SUMMARY_PROJECTION).sort(
+        [("updated_at", 1), ("id", 1)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        cursor = encode_cursor(changes[-1].get("updated_at"), changes[-1]["id"])
+    stats = await compute_stats()
+    return {"changes": changes, "stats": stats, "cursor": cursor, "has_more": has_more}
+
+@api_router.websocket("/ws/applications")
+async def application_feed_socket(websocket: WebSocket):
+    """Push channel for the Workbench: `changes`, `stats` and `resync` messages."""
+    await websocket.accept()
+    subscriber = application_feed.subscribe()
+
+    async def send_loop():
+        while True:
+            for message in await subscriber.next_messages():
+                await websocket.send_json(message)
+
+    async def receive_loop():
+        # Nothing is expected from the client; this only notices the disconnect
+        while True:
+            await websocket.receive_text()
+
+    tasks = [asyncio.create_task(send_loop()), asyncio.create_task(receive_loop())]
+    try:
+        await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        application_feed.unsubscribe(subscriber)
+
+@api_router.get("/applications/{application_id}", response_model=LoanApplication)
+async def get_application(application_id: str, request: Request):
+    app = await application_cache.get(application_id)
     if not app:
         raise HTTPException(status_code=404, detail="Application not found")
-    return app
+    etag = make_etag(application_id, app.get("version"), app.get("updated_at"))
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return not_modified(etag)
+    return json_response({k: v for k, v in app.items() if k != "chat_context"}, {"ETag": etag, "Cache-Control": CACHE_CONTROL})
 
 @api_router.put("/applications/{application_id}/review-status")
 async def update_review_status(application_id: str, body: ReviewStatusUpdate):
-    result = await db.applications.update_one(
+    """Set the review status and return only what changed, plus the stats card deltas."""
+    now = datetime.now(timezone.utc).isoformat()
+    before = await db.applications.find_one_and_update(
         {"id": application_id},
-        {"$set": {"review_status": body.review_status, "updated_at": datetime.now(timezone.utc).isoformat()}}
+        {"$set": {"review_status": body.review_status, "updated_at": now}, "$inc": {"version": 1}},
+        projection={**ROLLUP_PROJECTION, "version": 1},
+        return_document=ReturnDocument.BEFORE,
     )
-    if result.matched_count == 0:
+    if before is None:
         raise HTTPException(status_code=404, detail="Application not found")
-    updated = await db.applications.find_one({"id": application_id}, {"_id": 0})
-    return updated
+    await apply_rollup_deltas(rollup_deltas(before, {**before, "review_status": body.review_status}))
+    application_cache.invalidate([application_id])
+    await bump_applications_version(content=False)
+    await answer_cache.invalidate_application(application_id)
+    return {
+        "id": application_id,
+        "review_status": body.review_status,
+        "updated_at": now,
+        "version": before.get("version", 0) + 1,
+        "stats_delta": stats_delta(before.get("review_status"), body.review_status, bool(before.get("is_overdue"))),
+    }
+
+@app.exception_handler(ChatWriteError)
+async def chat_write_error_handler(request: Request, exc: ChatWriteError):
+    logger.error(f"Chat error: {exc}")
+    return JSONResponse(status_code=503, content={"detail": "Chat message could not be saved, try again"})
 
 @api_router.post("/chat", response_model=ChatResponse)
 async def chat_with_ai(body: ChatRequest):
-    # Store user message
-    user_msg_id = str(uuid.uuid4())
-    user_msg = {
-        "id": user_msg_id,
-        "session_id": body.session_id,
-        "application_id": body.application_id,
-        "role": "user",
-        "content": body.message,
-        "timestamp": datetime.now(timezone.utc).isoformat()
-    }
-    await db.chat_messages.insert_one(user_msg)
+    user_msg = chat_message(body, "user", body.message)
+    with span("chat.load_application"):
+        app_data = await load_chat_application(body.application_id)
+    with span("chat.build_prompt"):
+        _, initial_messages, prompt_tokens = await build_chat_prompt(body, app_data)
+    cache_key = chat_cache_key(body, app_data, initial_messages)
+    with span("chat.cache_lookup"):
+        cached = await answer_cache.get(cache_key)
+    if cached is not None:
+        ai_msg = chat_message(body, "assistant", cached)
+        await chat_writer.write_turn(user_msg, ai_msg)
+        return ChatResponse(response=cached, message_id=ai_msg["id"], prompt_tokens=prompt_tokens)
+    # A double submit joins the turn already in flight and gets the same response
+    return await chat_turns.do(
+        chat_turn_key(body), lambda: answer_chat_turn(body, user_msg, initial_messages, prompt_tokens, cache_key)
+    )
 
-    # Build context
-    system_prompt = """You are an AI underwriting assistant for myridius EVOQ Commercial Lending Workbench. You help commercial lending analysts understand loan applications, financial analysis, risk assessments, and AI agent decisions.
+async def answer_chat_turn(
+    body: ChatRequest, user_msg: dict, initial_messages: List[dict], prompt_tokens: int, cache_key: str
+) -> ChatResponse:
+    async with chat_admission.slot(body.session_id):
+        try:
+            started = time.perf_counter()
+            response_text = await llm_gateway.complete(initial_messages + [{"role": "user", "content": body.message}])
+            await answer_cache.set(cache_key, body.application_id, response_text, (time.perf_counter() - started) * 1000)
 
-RESPONSE FORMAT RULES:
-- Always respond in plain, natural language — NEVER return JSON, code blocks, or raw data structures.
-- Be concise and to the point. Use short bullet points when listing multiple items.
-- Use markdown formatting: **bold** for emphasis, bullet points (- or *) for lists.
-- Keep responses brief (3-5 bullet points max) unless the user explicitly asks for a detailed explanation.
-- When referencing financial data, present it naturally (e.g., "Tesla's D/E ratio improved from 0.79 to 0.68") — never dump raw numbers or objects.
-- Sound like a knowledgeable analyst having a conversation, not a database query."""
+            ai_msg = chat_message(body, "assistant", response_text)
+            with span("chat.persist"):
+                await chat_writer.write_turn(user_msg, ai_msg)
+            return ChatResponse(response=response_text, message_id=ai_msg["id"], prompt_tokens=prompt_tokens)
 
-    if body.application_id:
-        app_data = await db.applications.find_one({"id": body.application_id}, {"_id": 0})
-        if app_data:
-            # Provide structured summary instead of raw JSON dump
-            context_parts = [
-                f"Applicant: {app_data.get('applicant_name')} ({app_data.get('application_no')})",
-                f"Industry: {app_data.get('industry')} | Entity: {app_data.get('legal_entity_type')}",
-                f"Loan: {app_data.get('loan_amount_display')} | Stage: {app_data.get('application_stage')}",
-                f"AI Status: {app_data.get('application_status')} | Review: {app_data.get('review_status')}",
-                f"AI Recommendation: {app_data.get('ai_recommendation', {}).get('action')} — {app_data.get('ai_recommendation', {}).get('notes')}",
-                f"Summary: {app_data.get('application_summary')}",
-                f"Insights: {app_data.get('insights_synthesis')}",
-            ]
-            if app_data.get('company_insights'):
-                context_parts.append("Key Insights:\n" + "\n".join(f"  - {i}" for i in app_data['company_insights']))
-            if app_data.get('key_ratios'):
-                de = app_data['key_ratios'].get('debt_to_equity', [])
-                icr = app_data['key_ratios'].get('interest_coverage', [])
-                if de:
-                    de_str = ', '.join(str(d['year']) + ': ' + str(d['value']) for d in de)
-                    context_parts.append(f"D/E Ratio: {de_str}")
-                if icr:
-                    icr_str = ', '.join(str(d['year']) + ': ' + str(d['value']) + 'x' for d in icr)
-                    context_parts.append(f"ICR: {icr_str}")
-            if app_data.get('covenant_recommendations'):
-                cov_str = "; ".join(str(c['value']) + ' ' + str(c['metric']) for c in app_data['covenant_recommendations'])
-                context_parts.append(f"Covenants: {cov_str}")
-
-            system_prompt += f"\n\nCurrent application context:\n" + "\n".join(context_parts)
-
-    # Get conversation history for context continuity (excluding the message just inserted)
-    history = await db.chat_messages.find(
-        {"session_id": body.session_id, "id": {"$ne": user_msg_id}},
-        {"_id": 0}
-    ).sort("timestamp", 1).limit(20).to_list(20)
-
-    # Build initial_messages with system prompt + conversation history
-    initial_messages = [{"role": "system", "content": system_prompt}]
-    for msg in history:
-        initial_messages.append({"role": msg["role"], "content": msg["content"]})
+        except LlmError as e:
+            logger.error(f"Chat error: {e}")
+            await chat_writer.write_failed_turn(user_msg, str(e))
+            raise HTTPException(status_code=e.status_code, detail=f"AI service error: {str(e)}")
+        except ChatWriteError:
+            raise  # nothing more can be saved for this turn; answered 503 by the handler below
+        except Exception as e:
+            logger.error(f"Chat error: {e}")
+            await chat_writer.write_failed_turn(user_msg, str(e))
+            raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
 
+async def replay_turn(turn: asyncio.Future):
+    """SSE for a duplicate of an in-flight turn: its whole answer as one token, then done."""
     try:
-        chat = LlmChat(
-            api_key=GEMINI_API_KEY,
-            session_id=body.session_id,
-            system_message=system_prompt,
-            initial_messages=initial_messages,
-        ).with_model("gemini", "gemini-2.0-flash")
-
-        # Send only the new message — history is already loaded
-        response_text = await chat.send_message(UserMessage(text=body.message))
-
-        # Store assistant response
-        ai_msg_id = str(uuid.uuid4())
-        ai_msg = {
-            "id": ai_msg_id,
-            "session_id": body.session_id,
-            "application_id": body.application_id,
-            "role": "assistant",
-            "content": response_text,
-            "timestamp": datetime.now(timezone.utc).isoformat()
-        }
-        await db.chat_messages.insert_one(ai_msg)
+        result = await asyncio.shield(turn)
+    except ChatWriteError:
+        yield sse_event("error", {"detail": "Chat message could not be saved, try again"})
+        return
+    except HTTPException as e:
+        yield sse_event("error", {"detail": e.detail})
+        return
+    yield sse_event("token", {"text": result.response})
+    yield sse_event("done", {"message_id": result.message_id, "prompt_tokens": result.prompt_tokens})
 
-        return ChatResponse(response=response_text, message_id=ai_msg_id)
+@api_router.post("/chat/stream")
+async def chat_with_ai_stream(body: ChatRequest, request: Request):
+    """Server-Sent Events variant of /chat.
 
-    except Exception as e:
-        logger.error(f"Chat error: {e}")
-        raise HTTPException(status_code=500, detail=f"AI service error: {str(e)}")
+    Emits `token` events as the model generates, then a `done` event carrying the
+    assistant message id. The turn is persisted only once the stream completes; if the
+    client disconnects first, the upstream generation is cancelled and the turn is
+    recorded as failed. A duplicate of a turn still in flight replays that turn's answer
+    rather than calling the model again.
+    """
+    user_msg = chat_message(body, "user", body.message)
+    with span("chat.load_application"):
+        app_data = await load_chat_application(body.application_id)
+    with span("chat.build_prompt"):
+        _, initial_messages, prompt_tokens = await build_chat_prompt(body, app_data)
+    cache_key = chat_cache_key(body, app_data, initial_messages)
+    with span("chat.cache_lookup"):
+        cached = await answer_cache.get(cache_key)
+    if cached is not None:
+        async def cached_stream():
+            yield sse_event("token", {"text": cached})
+            ai_msg = chat_message(body, "assistant", cached)
+            await chat_writer.write_turn(user_msg, ai_msg)
+            yield sse_event("done", {"message_id": ai_msg["id"], "prompt_tokens": prompt_tokens})
+        return StreamingResponse(cached_stream(), media_type="text/event-stream")
+
+    turn_key = chat_turn_key(body)
+    in_flight = chat_turns.running(turn_key)
+    if in_flight is not None:
+        # A double submit replays the turn already in flight (from /chat or a stream)
+        CHAT_COALESCED.inc(1, chat_turns.kind)
+        return StreamingResponse(replay_turn(in_flight), media_type="text/event-stream")
+
+    # Rejected here, while a 429 can still be sent; the slot itself is held by the stream
+    chat_admission.check(body.session_id)
+    messages = initial_messages + [{"role": "user", "content": body.message}]
+    turn = chat_turns.claim(turn_key, CHAT_TURN_TIMEOUT_SECONDS)
+
+    async def event_stream():
+        parts = []
+        try:
+            acquired_at = await chat_admission.acquire(body.session_id)
+        except HTTPException as e:
+            settle(turn, e)
+            await chat_writer.write_failed_turn(user_msg, e.detail)
+            yield sse_event("error", {"detail": e.detail, "retry_after": int(e.headers["Retry-After"])})
+            return
+        upstream = llm_gateway.stream(messages)
+        started = time.perf_counter()
+        try:
+            async for text in upstream:
+                if await request.is_disconnected():
+                    logger.info(f"Chat stream client disconnected (session {body.session_id})")
+                    await chat_writer.write_failed_turn(user_msg, "client disconnected")
+                    return
+                parts.append(text)
+                yield sse_event("token", {"text": text})
+
+            response_text = "".join(parts)
+            await answer_cache.set(cache_key, body.application_id, response_text, (time.perf_counter() - started) * 1000)
+            ai_msg = chat_message(body, "assistant", response_text)
+            with span("chat.persist"):
+                await chat_writer.write_turn(user_msg, ai_msg)
+            settle(turn, ChatResponse(response=response_text, message_id=ai_msg["id"], prompt_tokens=prompt_tokens))
+            yield sse_event("done", {"message_id": ai_msg["id"], "prompt_tokens": prompt_tokens})
+        except ChatWriteError as e:
+            logger.error(f"Chat stream error: {e}")
+            settle(turn, e)
+            yield sse_event("error", {"detail": "Chat message could not be saved, try again"})
+        except asyncio.CancelledError:
+            logger.info(f"Chat stream cancelled (session {body.session_id})")
+            chat_writer.enqueue({**user_msg, "status": "failed", "error": "cancelled"})
+            raise
+        except GeneratorExit:
+            # Closed at a yield once the client went away; nothing more can be sent
+            logger.info(f"Chat stream closed (session {body.session_id})")
+            chat_writer.enqueue({**user_msg, "status": "failed", "error": "client disconnected"})
+            raise
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}")
+            settle(turn, HTTPException(status_code=getattr(e, "status_code", 500), detail=f"AI service error: {str(e)}"))
+            await chat_writer.write_failed_turn(user_msg, str(e))
+            yield sse_event("error", {"detail": f"AI service error: {str(e)}"})
+        finally:
+            # Disconnected or cancelled: joined duplicates fail too, and may resend
+            settle(turn, HTTPException(status_code=503, detail="Chat turn was interrupted, try again"))
+            # Before any await, so a cancelled close can never leak the admission slot
+            chat_admission.release(body.session_id, acquired_at)
+            await upstream.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        # Proxies must not buffer the stream, or tokens arrive all at once
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@api_router.post("/applications/{application_id}/analysis-jobs")
+async def create_analysis_job(application_id: str, body: AnalysisJobRequest):
+    job = await enqueue_analysis_job(application_id, body)
+    return {k: v for k, v in job.items() if k not in ("run_after", "lease_expires_at")}
+
+@api_router.get("/jobs")
+async def list_jobs(
+    status: Optional[Literal["queued", "running", "succeeded", "failed"]] = None,
+    application_id: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=200),
+):
+    query = {}
+    if status:
+        query["status"] = status
+    if application_id:
+        query["application_id"] = application_id
+    jobs = await db.jobs.find(query, {"_id": 0, "run_after": 0, "lease_expires_at": 0}).sort(
+        "created_at", -1
+    ).limit(limit).to_list(limit)
+    return {"jobs": jobs}
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await db.jobs.find_one({"id": job_id}, {"_id": 0, "run_after": 0, "lease_expires_at": 0})
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.get("/llm/status")
+async def get_llm_status():
+    return {**llm_gateway.status(), "chat_admission": chat_admission.status()}
+
+@api_router.get("/rollups")
+async def get_rollups(dimension: Optional[Literal["industry", "legal_entity_type", "review_status"]] = None):
+    query = {"dimension": dimension} if dimension else {}
+    rollups = await db.rollups.find({**query, "count": {"$gt": 0}}, {"_id": 0}).sort(
+        [("dimension", 1), ("loan_amount", -1)]
+    ).to_list(None)
+    return {"rollups": rollups}
+
+@api_router.post("/rollups/reconcile")
+async def reconcile_rollups_now(repair: bool = False):
+    return await reconcile_rollups(repair)
+
+@api_router.get("/analytics/summary")
+async def get_analytics_summary():
+    portfolio = await portfolio_analytics.get()
+    return {"version": portfolio.version, "computed_at": portfolio.computed_at, **portfolio.summary()}
+
+@api_router.get("/analytics/industries")
+async def get_analytics_industries():
+    portfolio = await portfolio_analytics.get()
+    return {"version": portfolio.version, "computed_at": portfolio.computed_at, "industries": portfolio.industries()}
+
+@api_router.get("/analytics/rankings")
+async def get_analytics_rankings(
+    metric: Literal["interest_coverage", "debt_to_equity", "revenue", "operating_margin"] = "interest_coverage",
+    order: Literal["asc", "desc"] = "asc",
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """Applications by the latest value of a metric, with its trend and portfolio percentile."""
+    portfolio = await portfolio_analytics.get()
+    return {
+        "version": portfolio.version,
+        "metric": metric,
+        "applications": portfolio.rankings(metric, order, limit),
+    }
+
+@api_router.get("/analytics/outliers")
+async def get_analytics_outliers(
+    rule: Optional[List[Literal["deteriorating_icr", "margin_compression", "high_leverage"]]] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    portfolio = await portfolio_analytics.get()
+    rules = rule or list(OUTLIER_RULES)
+    return {"version": portfolio.version, "rules": rules, "applications": portfolio.outliers(rules, limit)}
+
+@api_router.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@api_router.get("/chat/cache/stats")
+async def get_chat_cache_stats():
+    return await answer_cache.metrics()
+
+CHAT_HISTORY_PROJECTIONS = {
+    "full": {"_id": 0},
+    "compact": {"_id": 0, "id": 1, "role": 1, "content": 1, "timestamp": 1, "status": 1},
+}
+
+def project_message(message: dict, view: str) -> dict:
+    if view == "compact":
+        return {k: message[k] for k in CHAT_HISTORY_PROJECTIONS["compact"] if k in message}
+    return message
+
+# Tells an `after` timestamp from a message id (a UUID never starts like a date)
+ISO_DATE_PREFIX = re.compile(r"\d{4}-\d{2}-\d{2}")
 
 @api_router.get("/chat/{session_id}/history")
-async def get_chat_history(session_id: str):
-    messages = await db.chat_messages.find(
-        {"session_id": session_id},
-        {"_id": 0}
-    ).sort("timestamp", 1).to_list(100)
-    return {"messages": messages}
+async def get_chat_history(
+    session_id: str,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    view: Literal["full", "compact"] = "full",
+):
+    """A page of a session's messages, always in chronological order.
+
+    Without `after`, pages walk backwards from the newest message: follow `before` (the
+    returned cursor) to load older ones. With `after` (a message id or an ISO timestamp),
+    returns the messages that came after it, oldest first, so clients holding a transcript
+    only fetch what is new; repeat with the last id while `has_more`. An id not found
+    returns no messages rather than an error: with several workers in batched mode it may
+    still be buffered in another one, and shows up once that worker flushes.
+    """
+    if before and after:
+        raise HTTPException(status_code=400, detail="Pass either before or after, not both")
+    projection = CHAT_HISTORY_PROJECTIONS[view]
+    query = {"session_id": session_id}
+    # Snapshot the write buffer before reading, so a concurrent flush can't hide a message
+    pending = chat_writer.pending(session_id)
+
+    if after:
+        if ISO_DATE_PREFIX.match(after):
+            # Compared as stored: UTC isoformat, so other offsets and spellings sort correctly
+            try:
+                parsed = datetime.fromisoformat(after)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="after must be a message id in this session or an ISO timestamp")
+            after = (parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)).astimezone(timezone.utc).isoformat()
+            query["timestamp"] = {"$gt": after}
+            pending = [m for m in pending if m["timestamp"] > after]
+        else:
+            anchor = next((m for m in pending if m["id"] == after), None) or await db.chat_messages.find_one(
+                {"session_id": session_id, "id": after}, {"_id": 0, "id": 1, "timestamp": 1}
+            )
+            if anchor is None:
+                return {"messages": [], "before": None, "has_more": False}
+            key = (anchor["timestamp"], anchor["id"])
+            pending = [m for m in pending if (m["timestamp"], m["id"]) > key]
+            query["$or"] = [
+                {"timestamp": {"$gt": anchor["timestamp"]}},
+                {"timestamp": anchor["timestamp"], "id": {"$gt": anchor["id"]}},
+            ]
+        stored = await db.chat_messages.find(query, projection).sort(
+            [("timestamp", 1), ("id", 1)]
+        ).limit(limit + 1).to_list(limit + 1)
+        messages = [project_message(m, view) for m in merge_messages(stored, pending)[:limit + 1]]
+        has_more = len(messages) > limit
+        return {"messages": messages[:limit], "before": None, "has_more": has_more}
+
+    if before:
+        last_timestamp, last_id = decode_cursor(before)
+        query["$or"] = [
+            {"timestamp": {"$lt": last_timestamp}},
+            {"timestamp": last_timestamp, "id": {"$lt": last_id}},
+        ]
+        pending = [m for m in pending if (m["timestamp"], m["id"]) < (last_timestamp, last_id)]
+    stored = await db.chat_messages.find(query, projection).sort(
+        [("timestamp", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+    messages = [project_message(m, view) for m in merge_messages(stored, pending, newest_first=True)[:limit + 1]]
+    has_more = len(messages) > limit
+    messages = messages[:limit]
+    cursor = encode_cursor(messages[-1]["timestamp"], messages[-1]["id"]) if has_more else None
+    messages.reverse()
+    return {"messages": messages, "before": cursor, "has_more": has_more}
 
 # ---------- App Setup ----------
 app.include_router(api_router)
 
+app.add_middleware(CompressionMiddleware, minimum_size=1024)
+
 app.add_middleware(
     CORSMiddleware,
     allow_credentials=True,
@@ -625,6 +3881,81 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so recorded latency includes compression and CORS handling
+app.add_middleware(MetricsMiddleware)
+
+metrics.gauge("llm_in_flight", "LLM gateway calls in progress", lambda: llm_gateway.in_flight)
+metrics.gauge("llm_circuit_open", "1 while the LLM circuit breaker is open", lambda: int(llm_gateway.breaker.state == "open"))
+metrics.gauge("chat_answer_cache_hits", "Answer cache hits since start", lambda: answer_cache.hits)
+metrics.gauge("chat_answer_cache_misses", "Answer cache misses since start", lambda: answer_cache.misses)
+metrics.gauge("chat_writer_buffered_messages", "Chat messages waiting to be flushed", lambda: chat_writer.buffered)
+metrics.gauge("chat_writer_dead_letters", "Chat messages dropped after failed flushes (last 1000)",
+              lambda: len(chat_writer.dead_letters))
+metrics.gauge("chat_admitted", "Chat turns holding an admission slot", lambda: chat_admission.active)
+metrics.gauge("chat_waiting", "Chat turns queued for an admission slot", lambda: chat_admission.waiting)
+metrics.gauge("application_cache_hits", "Application document cache hits since start", lambda: application_cache.hits)
+metrics.gauge("application_cache_misses", "Application document cache misses since start", lambda: application_cache.misses)
+metrics.gauge("application_cache_bytes", "Encoded size of cached application documents",
+              lambda: application_cache.metrics()["bytes"])
+metrics.gauge("feed_subscribers", "Live feed WebSocket subscribers", lambda: len(application_feed.subscribers))
+metrics.gauge("process_resident_memory_bytes", "Resident set size of this worker", resident_memory_bytes)
+metrics.gauge("llm_provider_loaded", "1 once the LLM provider has been built", lambda: int(llm_gateway.provider_loaded))
+
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+metrics.gauge("process_import_seconds", "Time to import the application module", lambda: IMPORT_SECONDS)
+
+@app.on_event("startup")
+async def ensure_indexes():
+    bootstrap_start = time.perf_counter()
+    for collection, specs in INDEXES.items():
+        for keys, options in specs:
+            start = time.perf_counter()
+            try:
+                name = await db[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                # e.g. duplicate application_no in existing data; serve without the index
+                logger.error(f"Index build failed on {collection} {keys}: {e}")
+                continue
+            logger.info(f"Index {collection}.{name} ready in {(time.perf_counter() - start) * 1000:.1f} ms")
+    for collection, names in OBSOLETE_INDEXES.items():
+        for name in names:
+            with contextlib.suppress(OperationFailure):  # already gone
+                await db[collection].drop_index(name)
+    logger.info(f"Index bootstrap finished in {(time.perf_counter() - bootstrap_start) * 1000:.1f} ms")
+    await backfill_derived_fields()
+    if not await db.rollups.find_one({}):
+        await rebuild_rollups()
+
+@app.on_event("startup")
+async def start_background_workers():
+    chat_writer.start()
+    await load_token_encoder()
+    for worker_no in range(ANALYSIS_WORKERS):
+        _worker_tasks.append(asyncio.create_task(analysis_worker(worker_no)))
+    if ROLLUP_RECONCILE_SECONDS > 0:
+        _worker_tasks.append(asyncio.create_task(rollup_reconciler()))
+    if APP_CACHE_MAX_BYTES > 0 and APP_CACHE_SYNC_SECONDS > 0:
+        _worker_tasks.append(asyncio.create_task(application_cache_sync()))
+
+@app.on_event("startup")
+async def report_startup():
+    deferred = [name for name in LAZY_MODULES if not module_loaded(name)]
+    logger.info(
+        f"Worker ready: imported in {IMPORT_SECONDS * 1000:.0f} ms, "
+        f"RSS {resident_memory_bytes() / 2 ** 20:.1f} MiB, deferred imports: {', '.join(deferred) or 'none'}"
+    )
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    for task in _worker_tasks:
+        task.cancel()
+    await asyncio.gather(*_worker_tasks, return_exceptions=True)
+    _worker_tasks.clear()
+    await application_feed.stop()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    # Buffered chat messages go out before the connection closes
+    await chat_writer.close()
     client.close()
+    await llm_gateway.aclose()
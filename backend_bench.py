@@ -0,0 +1,476 @@
+"""Latency benchmarks for the Workbench backend.
+
+Runs against a local MongoDB (MONGO_URL, default mongodb://localhost:27017) in a
+throwaway database (BENCH_DB_NAME, default "cl_bench") that is dropped afterwards.
+
+    python backend_bench.py stats --sizes 1000 10000 100000
+    python backend_bench.py search --sizes 1000 10000 100000
+    python backend_bench.py bulk --sizes 10 100 500 --repeat 5
+    python backend_bench.py serialize --sizes 100 1000 10000
+    python backend_bench.py analytics --sizes 1000 10000 100000
+    python backend_bench.py import --sizes 1000 10000 100000 --repeat 1
+    python backend_bench.py load --sizes 10000 --concurrency 32 --requests 2000 --llm-latency-ms 200
+
+The LLM is the deterministic fake provider unless LLM_PROVIDER is set, so the numbers
+measure this service rather than the upstream model.
+"""
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ["DB_NAME"] = os.environ.get("BENCH_DB_NAME", "cl_bench")
+os.environ.setdefault("LLM_PROVIDER", "fake")
+# Keep background work from competing with the measured requests
+os.environ.setdefault("ANALYSIS_WORKERS", "0")
+os.environ.setdefault("ROLLUP_RECONCILE_SECONDS", "0")
+sys.path.insert(0, str(Path(__file__).parent / "backend"))
+
+import server  # noqa: E402
+
+REVIEW_STATUSES = ["Review Pending", "Awaiting Instructions", "Approved", "Rejected"]
+
+
+def synthetic_applications(n):
+    """Scale the seed records up to n applications with unique ids/numbers."""
+    seeds = server.get_seed_applications()
+    apps = []
+    for i in range(n):
+        doc = dict(seeds[i % len(seeds)])
+        doc["id"] = f"bench-{i}"
+        doc["application_no"] = f"BN-{i:07d}"
+        doc["applicant_name"] = f"{doc['applicant_name']} {i}"
+        doc["review_status"] = REVIEW_STATUSES[i % len(REVIEW_STATUSES)]
+        doc["is_overdue"] = i % 3 == 0
+        doc.update(server.derived_fields(doc))
+        apps.append(doc)
+    return apps
+
+
+async def seed(n, batch_size=5000):
+    await server.db.applications.delete_many({})
+    apps = synthetic_applications(n)
+    for start in range(0, n, batch_size):
+        await server.db.applications.insert_many(apps[start:start + batch_size])
+    await server.ensure_indexes()
+    await server.rebuild_rollups()
+    server.application_cache.clear()
+
+
+async def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        "p50_ms": round(statistics.median(samples), 2),
+        "max_ms": round(max(samples), 2),
+    }
+
+
+# ---------- Stats ----------
+async def legacy_stats():
+    """The pre-aggregation stats path: pull every status into Python, filter three times."""
+    all_apps = await server.db.applications.find(
+        {}, {"_id": 0, "review_status": 1, "is_overdue": 1}
+    ).to_list(None)
+    pending = [a for a in all_apps if a.get("review_status") == "Review Pending"]
+    awaiting = [a for a in all_apps if a.get("review_status") == "Awaiting Instructions"]
+    completed = [a for a in all_apps if a.get("review_status") in ["Approved", "Rejected"]]
+    return {
+        "pending": {"count": len(pending), "overdue": sum(1 for a in pending if a.get("is_overdue"))},
+        "awaiting": {"count": len(awaiting), "overdue": sum(1 for a in awaiting if a.get("is_overdue"))},
+        "completed": {"count": len(completed), "overdue": sum(1 for a in completed if a.get("is_overdue"))},
+    }
+
+
+async def bench_stats(sizes, repeat):
+    results = []
+    for n in sizes:
+        await seed(n)
+        assert await legacy_stats() == await server.compute_stats()
+        results.append({
+            "rows": n,
+            "legacy": await timed(legacy_stats, repeat),
+            "rollups": await timed(server.compute_stats, repeat),
+            "full_scan": await timed(server.scan_rollups, repeat),
+        })
+        print(f"stats rows={n}: {json.dumps(results[-1])}", file=sys.stderr)
+    return results
+
+
+# ---------- Search ----------
+# Typeahead sequence for one query, keystroke by keystroke
+SEARCH_KEYSTROKES = ["n", "nv", "nvi", "nvid", "nvidia", "nvidia 4", "nvidia 42"]
+
+
+async def legacy_search(search, limit=50):
+    """The pre-index search path: three unanchored case-insensitive regexes."""
+    query = {"$or": [
+        {"applicant_name": {"$regex": search, "$options": "i"}},
+        {"application_no": {"$regex": search, "$options": "i"}},
+        {"industry": {"$regex": search, "$options": "i"}},
+    ]}
+    return await server.db.applications.find(query, server.SUMMARY_PROJECTION).to_list(limit)
+
+
+async def prefix_search(search, limit=50):
+    query = server.prefix_search_query(server.search_tokens(search))
+    return await server.db.applications.find(query, server.SUMMARY_PROJECTION).sort(
+        [("application_no", 1), ("id", 1)]
+    ).limit(limit).to_list(limit)
+
+
+async def text_search(search, limit=50):
+    return await server.db.applications.find(
+        {"$text": {"$search": search}},
+        {**server.SUMMARY_PROJECTION, "score": {"$meta": "textScore"}},
+    ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list(limit)
+
+
+async def bench_search(sizes, repeat):
+    results = []
+    for n in sizes:
+        await seed(n)
+        row = {"rows": n}
+        for name, fn in (("regex", legacy_search), ("prefix", prefix_search), ("text", text_search)):
+            async def typeahead(fn=fn):
+                for keystroke in SEARCH_KEYSTROKES:
+                    await fn(keystroke)
+            row[name] = await timed(typeahead, repeat)
+        results.append(row)
+        print(f"search rows={n}: {json.dumps(row)}", file=sys.stderr)
+    return results
+
+
+# ---------- Bulk review status ----------
+async def bench_bulk(sizes, repeat):
+    """Throughput of N review-status changes: N per-item PUTs vs one bulk PUT.
+
+    `sizes` is the number of applications updated per round, out of a 10k-row collection.
+    """
+    import httpx
+
+    await seed(max(10000, max(sizes)))
+    results = []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        for n in sizes:
+            ids = [f"bench-{i}" for i in range(n)]
+            round_no = 0
+
+            async def per_item():
+                nonlocal round_no
+                round_no += 1
+                status = REVIEW_STATUSES[round_no % len(REVIEW_STATUSES)]
+                for app_id in ids:
+                    resp = await http.put(f"/api/applications/{app_id}/review-status", json={"review_status": status})
+                    resp.raise_for_status()
+
+            async def bulk():
+                nonlocal round_no
+                round_no += 1
+                status = REVIEW_STATUSES[round_no % len(REVIEW_STATUSES)]
+                resp = await http.put("/api/applications/review-status:bulk", json={
+                    "updates": [{"id": app_id, "review_status": status} for app_id in ids]
+                })
+                resp.raise_for_status()
+
+            row = {"items": n}
+            for name, fn in (("per_item", per_item), ("bulk", bulk)):
+                timing = await timed(fn, repeat)
+                timing["items_per_s"] = round(n / (timing["p50_ms"] / 1000), 1)
+                row[name] = timing
+            results.append(row)
+            print(f"bulk items={n}: {json.dumps(row)}", file=sys.stderr)
+    return results
+
+
+# ---------- Serialization ----------
+async def bench_serialize(sizes, repeat):
+    """Encoding cost of a full-view /api/applications page of N documents (no Mongo involved).
+
+    encoder: jsonable_encoder + stdlib json (the default FastAPI path for a returned dict)
+    model: ApplicationsPage response-model validation + stdlib json
+    direct: json_response with stdlib json (what the route does)
+    direct_orjson: json_response with orjson (JSON_RESPONSE=orjson); skipped without orjson
+    """
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse, ORJSONResponse
+    from fastapi.routing import serialize_response
+
+    route = next(r for r in server.app.routes if getattr(r, "path", None) == "/api/applications")
+    has_orjson = importlib.util.find_spec("orjson") is not None
+    if not has_orjson:
+        print("serialize: orjson not installed, skipping direct_orjson", file=sys.stderr)
+    results = []
+    for n in sizes:
+        apps = synthetic_applications(n)
+        for doc in apps:
+            for field in ("search_terms", "chat_context"):
+                doc.pop(field)
+            doc["version"] = 1
+        page = {"applications": apps, "stats": {"pending": {"count": n, "overdue": 0}}, "next_cursor": None, "has_more": False}
+
+        async def encoder():
+            JSONResponse(jsonable_encoder(page))
+
+        async def model():
+            JSONResponse(await serialize_response(field=route.response_field, response_content=page))
+
+        async def direct():
+            JSONResponse(page)
+
+        async def direct_orjson():
+            ORJSONResponse(page)
+
+        row = {"docs": n}
+        variants = [("encoder", encoder), ("model", model), ("direct", direct)]
+        if has_orjson:
+            variants.append(("direct_orjson", direct_orjson))
+        for name, fn in variants:
+            row[name] = await timed(fn, repeat)
+        results.append(row)
+        print(f"serialize docs={n}: {json.dumps(row)}", file=sys.stderr)
+    return results
+
+# ---------- Portfolio analytics ----------
+async def bench_analytics(sizes, repeat):
+    """Cold build (load + vectorized metrics) vs a cached read, per portfolio size."""
+    results = []
+    for n in sizes:
+        await seed(n)
+
+        async def cold():
+            await server.bump_applications_version()
+            portfolio = await server.portfolio_analytics.get()
+            portfolio.summary()
+
+        async def cached():
+            portfolio = await server.portfolio_analytics.get()
+            portfolio.summary()
+            portfolio.industries()
+            portfolio.outliers(list(server.OUTLIER_RULES), 100)
+
+        row = {"rows": n, "cold": await timed(cold, repeat), "cached": await timed(cached, repeat)}
+        results.append(row)
+        print(f"analytics rows={n}: {json.dumps(row)}", file=sys.stderr)
+    return results
+
+
+# ---------- Streaming import ----------
+def import_records(n):
+    """n distinct NDJSON records, generated lazily like a large upload."""
+    seeds = server.get_seed_applications()
+    for i in range(n):
+        doc = {k: v for k, v in seeds[i % len(seeds)].items() if k not in server.IMPORT_SERVER_FIELDS}
+        doc["application_no"] = f"IM-{i:07d}"
+        doc["applicant_name"] = f"{doc['applicant_name']} {i}"
+        yield json.dumps(doc).encode() + b"\n"
+
+
+async def bench_import(sizes, repeat):
+    """Throughput and Python peak memory of POST /api/applications:import, per upload size.
+
+    Peak memory should stay flat across sizes: the body is consumed one batch at a time.
+    """
+    import httpx
+
+    results = []
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+        for n in sizes:
+            await server.db.applications.delete_many({})
+            await server.rebuild_rollups()
+
+            async def body():
+                chunk = []
+                for line in import_records(n):
+                    chunk.append(line)
+                    if len(chunk) == 100:
+                        yield b"".join(chunk)
+                        chunk = []
+                if chunk:
+                    yield b"".join(chunk)
+
+            peak = 0
+
+            async def upload():
+                nonlocal peak
+                tracemalloc.start()
+                resp = await http.post("/api/applications:import", content=body(),
+                                       headers={"Content-Type": "application/x-ndjson"})
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+                resp.raise_for_status()
+                assert resp.json()["failed"] == 0, resp.json()
+
+            timing = await timed(upload, repeat)
+            row = {"rows": n, **timing, "rows_per_s": round(n / (timing["p50_ms"] / 1000), 1),
+                   "peak_python_mb": round(peak / 2**20, 1)}
+            results.append(row)
+            print(f"import rows={n}: {json.dumps(row)}", file=sys.stderr)
+    return results
+
+
+# ---------- Load test ----------
+def latency_summary(samples, errors, rejected, elapsed):
+    """Percentiles (ms) of successful requests, and throughput, of one workload run.
+
+    429s from chat admission are load shedding rather than failures, so they are counted
+    as `rejected`, apart from `errors`, and kept out of the percentiles.
+    """
+    cuts = statistics.quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+    return {
+        "requests": len(samples) + errors + rejected,
+        "errors": errors,
+        "rejected": rejected,
+        "p50_ms": round(cuts[49], 2) if cuts else None,
+        "p95_ms": round(cuts[94], 2) if cuts else None,
+        "p99_ms": round(cuts[98], 2) if cuts else None,
+        "max_ms": round(max(samples), 2) if samples else None,
+        "throughput_rps": round((len(samples) + errors + rejected) / elapsed, 1),
+    }
+
+
+def load_workloads(n):
+    """name -> function(http, rng, worker_no) issuing one request of that kind."""
+    words = ["tesla", "nvidia", "automotive", "technology", "cl-3", "pepsi", "consumer"]
+
+    async def list_page(http, rng, worker_no):
+        return await http.get("/api/applications", params={"limit": 50})
+
+    async def search(http, rng, worker_no):
+        word = rng.choice(words)
+        return await http.get("/api/applications", params={"search": word[:rng.randint(2, len(word))]})
+
+    async def detail(http, rng, worker_no):
+        return await http.get(f"/api/applications/bench-{rng.randrange(n)}")
+
+    async def status_update(http, rng, worker_no):
+        return await http.put(f"/api/applications/bench-{rng.randrange(n)}/review-status",
+                              json={"review_status": rng.choice(REVIEW_STATUSES)})
+
+    async def chat(http, rng, worker_no):
+        # Unique questions, so every turn goes to the (fake) LLM rather than the answer cache.
+        # A session per worker: one turn in flight each, inside CHAT_MAX_PER_SESSION
+        return await http.post("/api/chat", json={
+            "session_id": f"load-{worker_no}",
+            "message": f"Summarize the key risks ({rng.random():.12f})",
+            "application_id": f"bench-{rng.randrange(n)}",
+        })
+
+    return {"list": list_page, "search": search, "detail": detail, "status_update": status_update, "chat": chat}
+
+
+async def run_workload(http, requests_fn, total, concurrency, seed):
+    samples, errors, rejected = [], 0, 0
+    counter = itertools.count()
+
+    async def worker(worker_no):
+        nonlocal errors, rejected
+        rng = random.Random(seed * 1000 + worker_no)
+        while next(counter) < total:
+            fn = requests_fn(rng)
+            start = time.perf_counter()
+            try:
+                status = (await fn(http, rng, worker_no)).status_code
+            except Exception:
+                status = None
+            if status is not None and status < 400:
+                samples.append((time.perf_counter() - start) * 1000)
+            elif status == 429:
+                rejected += 1
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return latency_summary(samples, errors, rejected, time.perf_counter() - start)
+
+
+async def bench_load(sizes, repeat, concurrency=16, requests=500, llm_latency_ms=200.0, workloads=None):
+    """Concurrent in-process load per endpoint (and a mixed run) against N seeded applications.
+
+    The app's startup hooks run as in production; requests go through the full ASGI stack
+    (middleware included) over httpx's in-process transport.
+    """
+    import httpx
+
+    if isinstance(server.llm_gateway.provider, server.FakeLlmProvider):
+        server.llm_gateway.provider.latency_ms = llm_latency_ms
+    results = []
+    await server.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as http:
+            for n in sizes:
+                await seed(n)
+                available = load_workloads(n)
+                chosen = workloads or list(available)
+                row = {"rows": n, "concurrency": concurrency, "llm_latency_ms": llm_latency_ms}
+                for round_no, name in enumerate(chosen):
+                    row[name] = await run_workload(http, lambda rng, fn=available[name]: fn, requests, concurrency, round_no)
+                # Workbench-like mix: mostly reads, some status changes and chat
+                weights = {"list": 30, "search": 25, "detail": 25, "status_update": 10, "chat": 10}
+                mix = [available[k] for k in chosen for _ in range(weights.get(k, 10))]
+                row["mixed"] = await run_workload(http, lambda rng: rng.choice(mix), requests, concurrency, len(chosen))
+                results.append(row)
+                print(f"load rows={n}: {json.dumps(row)}", file=sys.stderr)
+    finally:
+        await server.stop_background_workers()
+        await server.chat_writer.close()
+    return results
+
+
+BENCHMARKS = {
+    "stats": bench_stats,
+    "search": bench_search,
+    "bulk": bench_bulk,
+    "serialize": bench_serialize,
+    "analytics": bench_analytics,
+    "import": bench_import,
+    "load": bench_load,
+}
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=20)
+    load = parser.add_argument_group("load")
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--requests", type=int, default=500, help="requests per workload")
+    load.add_argument("--llm-latency-ms", type=float, default=200.0)
+    load.add_argument("--workloads", nargs="+", choices=["list", "search", "detail", "status_update", "chat"])
+    load.add_argument("--output", help="also write the JSON results to this file")
+    args = parser.parse_args()
+
+    options = {}
+    if args.benchmark == "load":
+        options = {"concurrency": args.concurrency, "requests": args.requests,
+                   "llm_latency_ms": args.llm_latency_ms, "workloads": args.workloads}
+    try:
+        results = await BENCHMARKS[args.benchmark](args.sizes, args.repeat, **options)
+        report = json.dumps({"benchmark": args.benchmark, "results": results}, indent=2)
+        print(report)
+        if args.output:
+            Path(args.output).write_text(report + "\n")
+    finally:
+        await server.client.drop_database(os.environ["DB_NAME"])
+        server.client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
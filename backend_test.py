@@ -1,7 +1,9 @@
 import requests
 import sys
 import json
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from threading import Barrier
+from datetime import datetime, timedelta, timezone
 
 class CommercialLendingAPITester:
     def __init__(self, base_url="https://commercial-validator.preview.emergentagent.com"):
@@ -137,6 +139,35 @@ class CommercialLendingAPITester:
         
         return success1 and success2 and success3, None
 
+    def test_paginate_applications(self):
+        """Test keyset pagination over the application list"""
+        success, first = self.run_test(
+            "Get First Page",
+            "GET",
+            "applications",
+            200,
+            params={'limit': 3, 'sort': 'loan_amount', 'order': 'desc'}
+        )
+        if not success or not first.get('next_cursor'):
+            return success, None
+
+        success, second = self.run_test(
+            "Get Second Page",
+            "GET",
+            "applications",
+            200,
+            params={'limit': 3, 'sort': 'loan_amount', 'order': 'desc', 'cursor': first['next_cursor']}
+        )
+        if success:
+            first_ids = {a['id'] for a in first['applications']}
+            if any(a['id'] in first_ids for a in second['applications']):
+                print("   ❌ Pages overlap")
+                return False, None
+            if 'financial_analysis' in second['applications'][0]:
+                print("   ⚠️  Summary view returned full documents")
+            print("   ✅ Pages are disjoint")
+        return success, None
+
     def test_get_application_detail(self, app_id):
         """Test getting a specific application detail"""
         if not app_id:
@@ -163,19 +194,223 @@ class CommercialLendingAPITester:
         
         return success, app_id
 
+    def test_conditional_get(self, app_id):
+        """Test ETag revalidation on the application detail"""
+        if not app_id:
+            print("❌ No application ID provided for conditional GET test")
+            return False, None
+
+        url = f"{self.base_url}/api/applications/{app_id}"
+        self.tests_run += 1
+        print(f"\n🔍 Testing Conditional GET...")
+        print(f"   URL: {url}")
+        first = requests.get(url)
+        etag = first.headers.get('ETag')
+        if not etag:
+            print("❌ Failed - No ETag on application detail")
+            return False, None
+        second = requests.get(url, headers={'If-None-Match': etag})
+        if second.status_code == 304 and not second.content:
+            self.tests_passed += 1
+            print(f"✅ Passed - 304 for ETag {etag}")
+            return True, etag
+        print(f"❌ Failed - Expected 304, got {second.status_code}")
+        return False, None
+
+    def test_import_applications(self):
+        """Test the streaming NDJSON import, including a row that fails validation"""
+        url = f"{self.base_url}/api/applications:import"
+        self.tests_run += 1
+        print(f"\n🔍 Testing Import Applications...")
+        print(f"   URL: {url}")
+        record = {
+            "application_no": "IT-0001", "applicant_name": "Import Test Co", "industry": "Technology",
+            "loan_amount": 5000000, "loan_amount_display": "$5 M", "legal_entity_type": "Private",
+            "application_stage": "Underwriting", "documents_status": "missing",
+            "application_status": "On Hold by AI", "review_status": "Review Pending", "is_overdue": False,
+        }
+        body = json.dumps(record) + "\n" + json.dumps({"application_no": "IT-0002"}) + "\n"
+        response = requests.post(url, data=body.encode(), headers={'Content-Type': 'application/x-ndjson'})
+        if response.status_code != 200:
+            print(f"❌ Failed - Expected 200, got {response.status_code}")
+            return False, None
+        report = response.json()
+        if report.get('inserted', 0) + report.get('updated', 0) == 1 and report.get('failed') == 1:
+            self.tests_passed += 1
+            print(f"✅ Passed - {report['failed_batches'][0]['errors']}")
+            return True, report
+        print(f"❌ Failed - Unexpected report: {report}")
+        return False, report
+
     def test_update_review_status(self, app_id):
         """Test updating application review status"""
         if not app_id:
             print("❌ No application ID provided for status update test")
             return False, None
             
-        return self.run_test(
+        success, response = self.run_test(
             "Update Review Status",
             "PUT",
             f"applications/{app_id}/review-status", 
             200,
             data={'review_status': 'Approved'}
         )
+        if success:
+            if 'stats_delta' in response and 'version' in response:
+                print(f"   ✅ Delta response: {response['stats_delta']}")
+            else:
+                print("   ❌ Missing stats_delta/version in response")
+        return success, response
+
+    def test_detail_after_update(self, app_id):
+        """Test that a cached application detail reflects a review-status change at once"""
+        if not app_id:
+            print("❌ No application ID provided for detail-after-update test")
+            return False, None
+        self.run_test("Warm Application Detail", "GET", f"applications/{app_id}", 200)
+        self.run_test(
+            "Update Review Status (cached)",
+            "PUT",
+            f"applications/{app_id}/review-status",
+            200,
+            data={'review_status': 'Awaiting Instructions'}
+        )
+        success, response = self.run_test("Application Detail After Update", "GET", f"applications/{app_id}", 200)
+        if success and response.get('review_status') != 'Awaiting Instructions':
+            print(f"   ❌ Stale detail: review_status is {response.get('review_status')}")
+            return False, response
+        return success, response
+
+    def test_analytics_after_review_status(self, app_id):
+        """Test that a review-status update does not invalidate portfolio analytics"""
+        if not app_id:
+            print("❌ No application ID provided for analytics-after-update test")
+            return False, None
+        _, before = self.run_test("Analytics Summary (before)", "GET", "analytics/summary", 200)
+        self.run_test(
+            "Update Review Status (analytics)",
+            "PUT",
+            f"applications/{app_id}/review-status",
+            200,
+            data={'review_status': 'Review Pending'}
+        )
+        success, after = self.run_test("Analytics Summary (after)", "GET", "analytics/summary", 200)
+        if success and after.get('version') != before.get('version'):
+            print(f"   ❌ Analytics rebuilt for a review-status change: version {before.get('version')} -> {after.get('version')}")
+            return False, after
+        return success, after
+
+    def test_bulk_review_status(self, app_id):
+        """Test the bulk review-status endpoint, including a version conflict"""
+        if not app_id:
+            print("❌ No application ID provided for bulk update test")
+            return False, None
+
+        success, response = self.run_test(
+            "Bulk Update Review Status",
+            "PUT",
+            "applications/review-status:bulk",
+            200,
+            data={'updates': [
+                {'id': app_id, 'review_status': 'Awaiting Instructions'},
+                {'id': 'does-not-exist', 'review_status': 'Approved'},
+            ]}
+        )
+        if not success:
+            return False, None
+        statuses = [r['status'] for r in response['results']]
+        if statuses == ['updated', 'not_found']:
+            print("   ✅ Per-item results correct")
+        else:
+            print(f"   ❌ Unexpected per-item results: {statuses}")
+
+        success, response = self.run_test(
+            "Bulk Update With Stale Version",
+            "PUT",
+            "applications/review-status:bulk",
+            200,
+            data={'updates': [{'id': app_id, 'review_status': 'Approved', 'expected_version': 0}]}
+        )
+        if success and response['results'][0]['status'] != 'conflict':
+            print("   ❌ Stale expected_version was not rejected")
+        return success, None
+
+    def test_analysis_job(self, app_id):
+        """Test queueing an AI analysis job and reading its status"""
+        if not app_id:
+            print("❌ No application ID provided for analysis job test")
+            return False, None
+
+        success, job = self.run_test(
+            "Queue Analysis Job",
+            "POST",
+            f"applications/{app_id}/analysis-jobs",
+            200,
+            data={'sections': ['insights_synthesis'], 'priority': 1}
+        )
+        if not success:
+            return False, None
+
+        success, status = self.run_test(
+            "Get Analysis Job",
+            "GET",
+            f"jobs/{job['id']}",
+            200
+        )
+        if success:
+            print(f"   Job status: {status.get('status')} (attempts: {status.get('attempts')})")
+        return success, job['id']
+
+    def test_rollups(self):
+        """Test that rollups match a full scan after the writes above"""
+        success, response = self.run_test(
+            "Rollups",
+            "GET",
+            "rollups",
+            200,
+            params={'dimension': 'review_status'}
+        )
+        if success:
+            total = sum(r['count'] for r in response.get('rollups', []))
+            print(f"   Applications across review statuses: {total}")
+        success, report = self.run_test(
+            "Reconcile Rollups",
+            "POST",
+            "rollups/reconcile",
+            200
+        )
+        if success and report.get('drift'):
+            print(f"   ❌ Rollup drift: {report['drift']}")
+        return success, report
+
+    def test_portfolio_analytics(self):
+        """Test the portfolio analytics endpoints"""
+        success, summary = self.run_test(
+            "Analytics Summary",
+            "GET",
+            "analytics/summary",
+            200
+        )
+        if success:
+            print(f"   Applications: {summary.get('applications')}, outliers: {summary.get('outliers')}")
+        success, rankings = self.run_test(
+            "Analytics Rankings",
+            "GET",
+            "analytics/rankings",
+            200,
+            params={'metric': 'interest_coverage', 'limit': 3}
+        )
+        if success:
+            values = [a['latest'] for a in rankings.get('applications', [])]
+            if values != sorted(values):
+                print(f"   ❌ Rankings not in ascending order: {values}")
+        return self.run_test(
+            "Analytics Outliers",
+            "GET",
+            "analytics/outliers",
+            200,
+            params={'rule': 'deteriorating_icr'}
+        )
 
     def test_chat_functionality(self):
         """Test chat with AI (Gemini 2.0 Flash)"""
@@ -218,6 +453,91 @@ class CommercialLendingAPITester:
             }
         )
 
+    def test_chat_double_submit(self):
+        """Test that two identical in-flight chat requests share one turn"""
+        url = f"{self.base_url}/api/chat"
+        self.tests_run += 1
+        print(f"\n🔍 Testing Chat Double Submit...")
+        print(f"   URL: {url}")
+        # Unique text, so neither request is an answer-cache hit that bypasses coalescing
+        stamp = datetime.now().strftime('%H%M%S%f')
+        session_id = f"{self.session_id}-double-{stamp}"
+        body = {'session_id': session_id, 'message': f'Summarize the portfolio risk in one line ({stamp})'}
+        start = Barrier(2)
+
+        def submit(_):
+            start.wait()
+            return requests.post(url, json=body)
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            responses = list(pool.map(submit, range(2)))
+        if any(r.status_code != 200 for r in responses):
+            print(f"❌ Failed - Status codes {[r.status_code for r in responses]}")
+            return False, None
+        ids = [r.json()['message_id'] for r in responses]
+        if ids[0] != ids[1]:
+            print(f"❌ Failed - Separate turns were answered: {ids}")
+            return False, ids
+        history = requests.get(f"{self.base_url}/api/chat/{session_id}/history").json()
+        if len(history.get('messages', [])) != 2:
+            print(f"❌ Failed - Expected one turn (2 messages) in history, got {len(history.get('messages', []))}")
+            return False, history
+        self.tests_passed += 1
+        print(f"✅ Passed - coalesced into one turn ({ids[0]})")
+        return True, ids
+
+    def test_chat_stream_double_submit(self):
+        """Test that two identical in-flight chat streams share one turn"""
+        url = f"{self.base_url}/api/chat/stream"
+        self.tests_run += 1
+        print(f"\n🔍 Testing Chat Stream Double Submit...")
+        print(f"   URL: {url}")
+        stamp = datetime.now().strftime('%H%M%S%f')
+        session_id = f"{self.session_id}-stream-double-{stamp}"
+        body = {'session_id': session_id, 'message': f'Summarize the portfolio risk in one line ({stamp})'}
+        start = Barrier(2)
+
+        def submit(_):
+            start.wait()
+            events = requests.post(url, json=body).text.strip().split("\n\n")
+            done = [e for e in events if e.startswith("event: done")]
+            return json.loads(done[0].split("data: ", 1)[1])['message_id'] if done else None
+
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            ids = list(pool.map(submit, range(2)))
+        if None in ids or ids[0] != ids[1]:
+            print(f"❌ Failed - Expected one shared turn, got message ids {ids}")
+            return False, ids
+        history = requests.get(f"{self.base_url}/api/chat/{session_id}/history").json()
+        if len(history.get('messages', [])) != 2:
+            print(f"❌ Failed - Expected one turn (2 messages) in history, got {len(history.get('messages', []))}")
+            return False, history
+        self.tests_passed += 1
+        print(f"✅ Passed - coalesced into one streamed turn ({ids[0]})")
+        return True, ids
+
+    def test_chat_cache_hit_prompt_tokens(self):
+        """Test that an answer-cache hit still reports prompt_tokens"""
+        stamp = datetime.now().strftime('%H%M%S%f')
+        message = f'List three covenant types briefly ({stamp})'
+        responses = []
+        # Fresh sessions share an empty context, so the second question is a cache hit
+        for n in range(2):
+            success, response = self.run_test(
+                f"Chat Cache {'Miss' if n == 0 else 'Hit'}",
+                "POST",
+                "chat",
+                200,
+                data={'session_id': f"{self.session_id}-cache-{stamp}-{n}", 'message': message}
+            )
+            if not success:
+                return False, None
+            responses.append(response)
+        if any(r.get('prompt_tokens') is None for r in responses):
+            print(f"   ❌ Missing prompt_tokens: {[r.get('prompt_tokens') for r in responses]}")
+            return False, responses
+        return True, responses
+
     def test_chat_history(self):
         """Test getting chat history"""
         return self.run_test(
@@ -227,6 +547,59 @@ class CommercialLendingAPITester:
             200
         )
 
+    def test_chat_history_pagination(self):
+        """Test paging chat history backwards and fetching only newer messages"""
+        success, first = self.run_test(
+            "Chat History Newest Page",
+            "GET",
+            f"chat/{self.session_id}/history",
+            200,
+            params={'limit': 1, 'view': 'compact'}
+        )
+        if not success or not first.get('messages'):
+            return success, first
+        newest = first['messages'][-1]
+        if 'application_id' in newest:
+            print("   ❌ Compact view still includes application_id")
+        if first.get('has_more'):
+            success, older = self.run_test(
+                "Chat History Older Page",
+                "GET",
+                f"chat/{self.session_id}/history",
+                200,
+                params={'limit': 1, 'before': first['before']}
+            )
+            if success and older['messages'] and older['messages'][-1]['timestamp'] > newest['timestamp']:
+                print("   ❌ Older page is newer than the first page")
+        success, newer = self.run_test(
+            "Chat History After Newest",
+            "GET",
+            f"chat/{self.session_id}/history",
+            200,
+            params={'after': newest['id']}
+        )
+        if success and newer.get('messages'):
+            print(f"   ❌ Expected no messages after the newest, got {len(newer['messages'])}")
+        # The same instant in another offset must select the same messages
+        shifted = datetime.fromisoformat(newest['timestamp']).astimezone(timezone(timedelta(hours=-5))).isoformat()
+        success, since = self.run_test(
+            "Chat History After Offset Timestamp",
+            "GET",
+            f"chat/{self.session_id}/history",
+            200,
+            params={'after': shifted}
+        )
+        if success and since.get('messages'):
+            print(f"   ❌ Expected no messages after {shifted}, got {len(since['messages'])}")
+        self.run_test(
+            "Chat History After Malformed Timestamp",
+            "GET",
+            f"chat/{self.session_id}/history",
+            400,
+            params={'after': '2026-13-45T99:00'}
+        )
+        return success, newer
+
 def main():
     print("🚀 Starting Commercial Lending AI Workbench API Tests")
     print("=" * 60)
@@ -240,8 +613,14 @@ def main():
         ("Seed Database", tester.test_seed_database),
         ("Get Applications", tester.test_get_applications),
         ("Search Applications", tester.test_search_applications),
+        ("Paginate Applications", tester.test_paginate_applications),
+        ("Portfolio Analytics", tester.test_portfolio_analytics),
         ("Chat Functionality", tester.test_chat_functionality),
-        ("Chat History", tester.test_chat_history)
+        ("Chat Double Submit", tester.test_chat_double_submit),
+        ("Chat Stream Double Submit", tester.test_chat_stream_double_submit),
+        ("Chat Cache Hit Prompt Tokens", tester.test_chat_cache_hit_prompt_tokens),
+        ("Chat History", tester.test_chat_history),
+        ("Chat History Pagination", tester.test_chat_history_pagination)
     ]
     
     # Run initial tests
@@ -259,8 +638,15 @@ def main():
     if app_id:
         dependent_tests = [
             ("Get Application Detail", lambda: tester.test_get_application_detail(app_id)),
+            ("Conditional GET", lambda: tester.test_conditional_get(app_id)),
             ("Update Review Status", lambda: tester.test_update_review_status(app_id)),
-            ("Chat with App Context", lambda: tester.test_chat_with_application_context(app_id))
+            ("Detail After Update", lambda: tester.test_detail_after_update(app_id)),
+            ("Analytics After Update", lambda: tester.test_analytics_after_review_status(app_id)),
+            ("Chat with App Context", lambda: tester.test_chat_with_application_context(app_id)),
+            ("Bulk Review Status", lambda: tester.test_bulk_review_status(app_id)),
+            ("Analysis Job", lambda: tester.test_analysis_job(app_id)),
+            ("Import Applications", tester.test_import_applications),
+            ("Rollups", tester.test_rollups)
         ]
         
         for test_name, test_func in dependent_tests:
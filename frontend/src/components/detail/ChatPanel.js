@@ -1,6 +1,6 @@
 import { useState, useRef, useEffect } from "react";
 import { Sparkles, Send } from "lucide-react";
-import { api } from "@/lib/api";
+import { api, appendToken, failStream } from "@/lib/api";
 import { ScrollArea } from "@/components/ui/scroll-area";
 import MarkdownMessage from "@/components/shared/MarkdownMessage";
 
@@ -21,8 +21,7 @@ export default function ChatPanel({ application }) {
   useEffect(() => {
     if (!sessionId) return;
     setHistoryLoaded(false);
-    api.getChatHistory(sessionId).then((res) => {
-      const history = res.data.messages || [];
+    api.loadChatHistory(sessionId).then((history) => {
       setMessages(history.map((m) => ({ role: m.role, content: m.content })));
       setHistoryLoaded(true);
     }).catch(() => {
@@ -37,11 +36,16 @@ export default function ChatPanel({ application }) {
     setMessages((prev) => [...prev, { role: "user", content: text }]);
     setLoading(true);
 
+    let started = false;
     try {
-      const res = await api.sendChat(sessionId, text, application?.id);
-      setMessages((prev) => [...prev, { role: "assistant", content: res.data.response }]);
+      await api.streamChat(sessionId, text, application?.id, (token) => {
+        const first = !started;
+        started = true;
+        setMessages((prev) => appendToken(prev, token, !first));
+        if (first) setLoading(false);
+      });
     } catch {
-      setMessages((prev) => [...prev, { role: "assistant", content: "Sorry, I encountered an error. Please try again." }]);
+      setMessages((prev) => failStream(prev, started, "Sorry, I encountered an error. Please try again."));
     } finally {
       setLoading(false);
     }
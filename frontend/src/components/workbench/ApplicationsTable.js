@@ -3,6 +3,7 @@ import { useNavigate } from "react-router-dom";
 import { Check, X, AlertTriangle, ChevronDown, ChevronUp, Eye, CircleCheck, CircleX, Clock } from "lucide-react";
 import { AnimatePresence } from "framer-motion";
 import ExpandedRow from "./ExpandedRow";
+import { api } from "@/lib/api";
 import {
   DropdownMenu,
   DropdownMenuContent,
@@ -43,10 +44,17 @@ const COLUMNS = [
 
 export default function ApplicationsTable({ applications, onStatusChange }) {
   const [expandedRow, setExpandedRow] = useState(null);
+  // Full application documents, loaded on first expansion (the list only carries table columns)
+  const [details, setDetails] = useState({});
   const navigate = useNavigate();
 
   const toggleRow = (id) => {
     setExpandedRow(expandedRow === id ? null : id);
+    if (expandedRow !== id && !details[id]) {
+      api.getApplication(id).then((res) => {
+        setDetails((prev) => ({ ...prev, [id]: res.data }));
+      }).catch((err) => console.error("Failed to fetch application:", err));
+    }
   };
 
   const handleNameClick = (app) => {
@@ -140,7 +148,7 @@ export default function ApplicationsTable({ applications, onStatusChange }) {
 
                     {/* Expanded Content */}
                     <AnimatePresence>
-                      {isExpanded && <ExpandedRow application={app} />}
+                      {isExpanded && <ExpandedRow application={{ ...details[app.id], ...app }} />}
                     </AnimatePresence>
                   </td>
                 </tr>
@@ -1,6 +1,6 @@
 import { useState, useRef, useEffect } from "react";
 import { Sparkles, Send, X } from "lucide-react";
-import { api } from "@/lib/api";
+import { api, appendToken, failStream } from "@/lib/api";
 import { motion, AnimatePresence } from "framer-motion";
 import MarkdownMessage from "@/components/shared/MarkdownMessage";
 
@@ -15,8 +15,7 @@ export default function ChatBar() {
 
   // Load existing history on mount
   useEffect(() => {
-    api.getChatHistory(SESSION_ID).then((res) => {
-      const history = res.data.messages || [];
+    api.loadChatHistory(SESSION_ID).then((history) => {
       if (history.length > 0) {
         setMessages(history.map((m) => ({ role: m.role, content: m.content })));
       }
@@ -31,11 +30,16 @@ export default function ChatBar() {
     setIsOpen(true);
     setLoading(true);
 
+    let started = false;
     try {
-      const res = await api.sendChat(SESSION_ID, userMsg);
-      setMessages((prev) => [...prev, { role: "assistant", content: res.data.response }]);
+      await api.streamChat(SESSION_ID, userMsg, null, (token) => {
+        const first = !started;
+        started = true;
+        setMessages((prev) => appendToken(prev, token, !first));
+        if (first) setLoading(false);
+      });
     } catch {
-      setMessages((prev) => [...prev, { role: "assistant", content: "Sorry, I couldn't process that request. Please try again." }]);
+      setMessages((prev) => failStream(prev, started, "Sorry, I couldn't process that request. Please try again."));
     } finally {
       setLoading(false);
     }
@@ -2,9 +2,38 @@ import axios from 'axios';
 
 const API_BASE = `${process.env.REACT_APP_BACKEND_URL}/api`;
 
+// Chat transcripts already loaded this page session, by session id
+const chatTranscripts = new Map();
+
+// Message-list updates for a streamed reply. appendToken adds a token to the trailing
+// assistant message, starting one on the first token; failStream swaps a partly streamed
+// reply for the error message, so a failed turn never leaves half an answer on screen.
+export const appendToken = (prev, token, started) => {
+  if (!started) return [...prev, { role: 'assistant', content: token }];
+  const next = [...prev];
+  const last = next[next.length - 1];
+  next[next.length - 1] = { ...last, content: last.content + token };
+  return next;
+};
+
+export const failStream = (prev, started, text) => [
+  ...(started ? prev.slice(0, -1) : prev),
+  { role: 'assistant', content: text },
+];
+
 export const api = {
-  getApplications: (search = '') =>
-    axios.get(`${API_BASE}/applications`, { params: search ? { search } : {} }),
+  getApplications: (search = '', { cursor, limit, sort, order } = {}) =>
+    axios.get(`${API_BASE}/applications`, {
+      params: {
+        ...(search ? { search } : {}),
+        ...(cursor ? { cursor } : {}),
+        ...(limit ? { limit } : {}),
+        ...(sort ? { sort, order } : {}),
+      },
+    }),
+
+  getApplicationChanges: ({ since, cursor } = {}) =>
+    axios.get(`${API_BASE}/applications/changes`, { params: cursor ? { cursor } : { since } }),
 
   getApplication: (id) =>
     axios.get(`${API_BASE}/applications/${id}`),
@@ -19,8 +48,94 @@ export const api = {
       application_id: applicationId,
     }),
 
-  getChatHistory: (sessionId) =>
-    axios.get(`${API_BASE}/chat/${sessionId}/history`),
+  // Server-Sent Events variant of sendChat: calls onToken for each chunk as it is
+  // generated and resolves with { message_id } once the reply has been stored.
+  streamChat: async (sessionId, message, applicationId = null, onToken = () => {}) => {
+    const res = await fetch(`${API_BASE}/chat/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ session_id: sessionId, message, application_id: applicationId }),
+    });
+    if (!res.ok || !res.body) throw new Error(`Chat stream failed: ${res.status}`);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      const events = buffer.split('\n\n');
+      buffer = events.pop();
+      for (const raw of events) {
+        const event = /^event: (.*)$/m.exec(raw)?.[1];
+        const data = JSON.parse(/^data: (.*)$/m.exec(raw)?.[1] || '{}');
+        if (event === 'token') onToken(data.text);
+        else if (event === 'done') return data;
+        else if (event === 'error') throw new Error(data.detail);
+      }
+    }
+    throw new Error('Chat stream ended unexpectedly');
+  },
+
+  getChatHistory: (sessionId, { before, after, limit, view } = {}) =>
+    axios.get(`${API_BASE}/chat/${sessionId}/history`, {
+      params: {
+        ...(before ? { before } : {}),
+        ...(after ? { after } : {}),
+        ...(limit ? { limit } : {}),
+        ...(view ? { view } : {}),
+      },
+    }),
+
+  // Transcript for a chat panel: the newest page on first load, then only the messages
+  // added since the last load when the panel is opened again.
+  loadChatHistory: async (sessionId) => {
+    let transcript = chatTranscripts.get(sessionId);
+    if (!transcript) {
+      const res = await api.getChatHistory(sessionId, { view: 'compact' });
+      transcript = res.data.messages;
+    } else {
+      let hasMore = true;
+      while (hasMore && transcript.length > 0) {
+        const after = transcript[transcript.length - 1].id;
+        const res = await api.getChatHistory(sessionId, { after, view: 'compact' });
+        transcript = [...transcript, ...res.data.messages];
+        hasMore = res.data.has_more;
+      }
+      if (transcript.length === 0) {
+        transcript = (await api.getChatHistory(sessionId, { view: 'compact' })).data.messages;
+      }
+    }
+    chatTranscripts.set(sessionId, transcript);
+    return transcript;
+  },
+
+  // Live Workbench feed. Reconnects after a drop; returns a function that closes it.
+  // onOpen(reconnected) and onClose() report the connection state.
+  subscribeApplications: (onMessage, { onOpen, onClose } = {}) => {
+    const url = `${API_BASE.replace(/^http/, 'ws')}/ws/applications`;
+    let socket;
+    let closed = false;
+    let opened = false;
+    const connect = () => {
+      socket = new WebSocket(url);
+      socket.onopen = () => {
+        onOpen?.(opened);
+        opened = true;
+      };
+      socket.onmessage = (e) => onMessage(JSON.parse(e.data));
+      socket.onclose = () => {
+        onClose?.();
+        if (!closed) setTimeout(connect, 2000);
+      };
+    };
+    connect();
+    return () => {
+      closed = true;
+      socket.close();
+    };
+  },
 
   seedDatabase: () =>
     axios.post(`${API_BASE}/seed`),
@@ -1,4 +1,4 @@
-import { useState, useEffect, useCallback } from "react";
+import { useState, useEffect, useCallback, useRef } from "react";
 import { Search, SlidersHorizontal, Plus } from "lucide-react";
 import { api } from "@/lib/api";
 import StatusCards from "@/components/workbench/StatusCards";
@@ -6,28 +6,132 @@ import ApplicationsTable from "@/components/workbench/ApplicationsTable";
 import ChatBar from "@/components/workbench/ChatBar";
 import { toast } from "sonner";
 
+const applyStatsDelta = (stats, delta = {}) => {
+  if (!stats) return stats;
+  const next = { ...stats };
+  for (const [bucket, change] of Object.entries(delta)) {
+    const current = next[bucket] || { count: 0, overdue: 0 };
+    next[bucket] = { count: current.count + change.count, overdue: current.overdue + change.overdue };
+  }
+  return next;
+};
+
+const MAX_CATCH_UP_PAGES = 5;
+
 export default function WorkbenchPage() {
   const [applications, setApplications] = useState([]);
   const [stats, setStats] = useState(null);
   const [search, setSearch] = useState("");
+  const [debouncedSearch, setDebouncedSearch] = useState("");
   const [loading, setLoading] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
 
   const fetchApplications = useCallback(async () => {
     try {
-      const res = await api.getApplications(search);
+      const res = await api.getApplications(debouncedSearch);
       setApplications(res.data.applications);
       setStats(res.data.stats);
+      setNextCursor(res.data.next_cursor);
     } catch (err) {
       console.error("Failed to fetch applications:", err);
     } finally {
       setLoading(false);
     }
+  }, [debouncedSearch]);
+
+  // Typeahead: query once the user pauses instead of on every keystroke
+  useEffect(() => {
+    const timer = setTimeout(() => setDebouncedSearch(search), 200);
+    return () => clearTimeout(timer);
   }, [search]);
 
+  const loadMore = async () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    try {
+      const res = await api.getApplications(debouncedSearch, { cursor: nextCursor });
+      setApplications((prev) => [...prev, ...res.data.applications]);
+      setStats(res.data.stats);
+      setNextCursor(res.data.next_cursor);
+    } catch (err) {
+      console.error("Failed to load more applications:", err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     fetchApplications();
   }, [fetchApplications]);
 
+  // The feed subscription outlives searches; it reloads through whatever query is current
+  const fetchRef = useRef(fetchApplications);
+  useEffect(() => {
+    fetchRef.current = fetchApplications;
+  }, [fetchApplications]);
+
+  // While the feed is connected it is the only source of stats: it sends absolute counts
+  // after every write, including our own, so also applying a PUT's delta would double it
+  const feedConnected = useRef(false);
+
+  // Newest updated_at among loaded rows: where to catch up from after the feed drops
+  const watermark = useRef("");
+  useEffect(() => {
+    watermark.current = applications.reduce((latest, a) => (a.updated_at > latest ? a.updated_at : latest), "");
+  }, [applications]);
+
+  const mergeChanges = (changes) => {
+    const byId = Object.fromEntries(changes.map((c) => [c.id, c]));
+    setApplications((prev) => prev.map((a) => (byId[a.id] ? { ...a, ...byId[a.id] } : a)));
+  };
+
+  // Changes made while disconnected are not replayed by the feed; page through them instead
+  // of reloading the table, or reload when too much has changed
+  const catchUp = async () => {
+    if (!watermark.current) {
+      fetchRef.current();
+      return;
+    }
+    try {
+      let params = { since: watermark.current };
+      for (let page = 0; page < MAX_CATCH_UP_PAGES; page += 1) {
+        const { data } = await api.getApplicationChanges(params);
+        mergeChanges(data.changes);
+        setStats(data.stats);
+        if (!data.has_more) return;
+        params = { cursor: data.cursor };
+      }
+      fetchRef.current();
+    } catch (err) {
+      console.error("Failed to catch up on application changes:", err);
+      fetchRef.current();
+    }
+  };
+
+  // Other reviewers' changes arrive over the live feed; merge them into loaded rows
+  useEffect(() => {
+    return api.subscribeApplications((msg) => {
+      if (msg.type === "changes") {
+        mergeChanges(msg.changes);
+      } else if (msg.type === "stats") {
+        setStats(msg.stats);
+      } else if (msg.type === "resync") {
+        fetchRef.current();
+      }
+    }, {
+      onOpen: (reconnected) => {
+        feedConnected.current = true;
+        if (reconnected) catchUp();
+      },
+      onClose: () => {
+        feedConnected.current = false;
+      },
+    });
+    // mergeChanges and catchUp only use setters and refs
+    // eslint-disable-next-line react-hooks/exhaustive-deps
+  }, []);
+
   // Seed on first load if no data
   useEffect(() => {
     if (!loading && applications.length === 0) {
@@ -40,8 +144,16 @@ export default function WorkbenchPage() {
 
   const handleStatusChange = async (appId, newStatus) => {
     try {
-      await api.updateReviewStatus(appId, newStatus);
-      fetchApplications();
+      const { data: patch } = await api.updateReviewStatus(appId, newStatus);
+      // Apply the returned delta locally instead of reloading the table
+      setApplications((prev) => prev.map((a) => (
+        a.id === patch.id
+          ? { ...a, review_status: patch.review_status, updated_at: patch.updated_at, version: patch.version }
+          : a
+      )));
+      if (!feedConnected.current) {
+        setStats((prev) => applyStatsDelta(prev, patch.stats_delta));
+      }
       toast.success(`Review status updated to "${newStatus}"`);
     } catch {
       toast.error("Failed to update review status");
@@ -92,6 +204,19 @@ export default function WorkbenchPage() {
         ) : (
           <ApplicationsTable applications={applications} onStatusChange={handleStatusChange} />
         )}
+
+        {!loading && nextCursor && (
+          <div className="flex justify-center">
+            <button
+              data-testid="load-more-btn"
+              onClick={loadMore}
+              disabled={loadingMore}
+              className="px-4 py-2 text-sm font-medium text-[#1a3a2a] border border-gray-200 rounded-lg bg-white hover:border-[#55C9A6] hover:text-[#55C9A6] transition-colors disabled:opacity-40"
+            >
+              {loadingMore ? "Loading..." : "Load more"}
+            </button>
+          </div>
+        )}
       </div>
 
       {/* Chat Bar */}
@@ -0,0 +1,33 @@
+"""Validation of the model's analysis-job answers before they are written (no MongoDB needed)."""
+import json
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cl_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import pytest  # noqa: E402
+from pydantic import ValidationError  # noqa: E402
+
+import server  # noqa: E402
+
+FORCES = ("buyer_power", "supplier_power", "threat_new_entrants", "threat_substitutes", "competitive_rivalry")
+
+
+def macro_answer(score) -> str:
+    forces = {force: {"score": 3, "description": "Moderate"} for force in FORCES}
+    forces["buyer_power"]["score"] = score
+    return json.dumps({"macro_analysis": {"summary": "Stable sector.", "porters_forces": forces}})
+
+
+def test_accepts_scores_in_range():
+    updates = server.parse_analysis_response(macro_answer(5), ["macro_analysis"])
+    assert updates["macro_analysis"]["porters_forces"]["buyer_power"]["score"] == 5
+
+
+@pytest.mark.parametrize("score", [0, 6, 42])
+def test_rejects_scores_out_of_range(score):
+    with pytest.raises(ValidationError):
+        server.parse_analysis_response(macro_answer(score), ["macro_analysis"])
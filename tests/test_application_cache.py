@@ -0,0 +1,69 @@
+"""Application cache projection and cross-worker reseed handling, against stub collections."""
+import asyncio
+import os
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cl_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import pytest  # noqa: E402
+
+import server  # noqa: E402
+
+
+class StubCollection:
+    """find_one by `id` (or `_id`) over a dict of documents."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.reads = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        doc = self.docs.get(query.get("id", query.get("_id")))
+        return dict(doc) if doc is not None else None
+
+
+@pytest.fixture
+def stub_db(monkeypatch):
+    applications = StubCollection({"app-1": {
+        "id": "app-1", "chat_context": "ctx", "review_status": "Approved", "updated_at": "t1", "financials": [1, 2],
+    }})
+    meta = StubCollection({"applications": {"_id": "applications", "version": 1, "seed_generation": 0}})
+    stub = SimpleNamespace(applications=applications, meta=meta)
+    monkeypatch.setattr(server, "db", stub)
+    return stub
+
+
+def test_projection_applies_to_cache_hits(stub_db):
+    cache = server.ApplicationCache(2 ** 20)
+
+    async def run():
+        miss = await cache.get("app-1", server.CHAT_APPLICATION_PROJECTION)
+        hit = await cache.get("app-1", server.CHAT_APPLICATION_PROJECTION)
+        whole = await cache.get("app-1")
+        return miss, hit, whole
+
+    miss, hit, whole = asyncio.run(run())
+    assert miss == hit == {"chat_context": "ctx", "review_status": "Approved", "updated_at": "t1"}
+    assert whole["financials"] == [1, 2]
+    assert stub_db.applications.reads == 1
+
+
+def test_reseed_elsewhere_clears_cache(stub_db):
+    cache = server.ApplicationCache(2 ** 20)
+
+    async def run():
+        await cache.sync()
+        await cache.get("app-1")
+        # Another worker reseeded: app-1 is gone, and nothing has a newer updated_at
+        del stub_db.applications.docs["app-1"]
+        stub_db.meta.docs["applications"].update(version=2, seed_generation=1)
+        await cache.sync()
+        return await cache.get("app-1")
+
+    assert asyncio.run(run()) is None
+    assert cache.metrics()["entries"] == 0
@@ -0,0 +1,78 @@
+"""Single-flight of duplicate chat turns across /chat and /chat/stream (no MongoDB needed)."""
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cl_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import pytest  # noqa: E402
+from fastapi import HTTPException  # noqa: E402
+
+import server  # noqa: E402
+
+
+def events(chunks):
+    return [(chunk.split("\n")[0].removeprefix("event: "), json.loads(chunk.split("\n")[1].removeprefix("data: ")))
+            for chunk in chunks]
+
+
+async def collect(stream):
+    return [chunk async for chunk in stream]
+
+
+def test_duplicate_joins_claimed_stream_turn():
+    flights = server.SingleFlight("turn")
+    answer = server.ChatResponse(response="It is fine.", message_id="m1", prompt_tokens=12)
+    calls = []
+
+    async def run():
+        turn = flights.claim("key", timeout=5)
+
+        async def complete():
+            calls.append(1)
+            return answer
+
+        joined = asyncio.create_task(flights.do("key", complete))
+        replayed = asyncio.create_task(collect(server.replay_turn(flights.running("key"))))
+        await asyncio.sleep(0)
+        server.settle(turn, answer)
+        return await joined, await replayed
+
+    joined, replayed = asyncio.run(run())
+    assert calls == []  # the stream's turn answered both, no second model call
+    assert joined == answer
+    assert events(replayed) == [
+        ("token", {"text": "It is fine."}),
+        ("done", {"message_id": "m1", "prompt_tokens": 12}),
+    ]
+    assert len(flights) == 0
+
+
+def test_failed_stream_turn_fails_duplicates():
+    flights = server.SingleFlight("turn")
+
+    async def run():
+        turn = flights.claim("key", timeout=5)
+        replayed = asyncio.create_task(collect(server.replay_turn(turn)))
+        await asyncio.sleep(0)
+        server.settle(turn, HTTPException(status_code=503, detail="Chat turn was interrupted, try again"))
+        return await replayed
+
+    assert events(asyncio.run(run())) == [("error", {"detail": "Chat turn was interrupted, try again"})]
+    assert len(flights) == 0
+
+
+def test_unsettled_claim_expires():
+    flights = server.SingleFlight("turn")
+
+    async def run():
+        turn = flights.claim("key", timeout=0.01)
+        with pytest.raises(HTTPException):
+            await turn
+
+    asyncio.run(run())
+    assert flights.running("key") is None
@@ -0,0 +1,85 @@
+"""Chat message writer failure handling, against a stub collection (no MongoDB needed)."""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cl_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import pytest  # noqa: E402
+from pymongo.errors import AutoReconnect, BulkWriteError  # noqa: E402
+
+import server  # noqa: E402
+
+
+class StubCollection:
+    """Raises each scripted error (or error factory, given the docs) in turn, then stores docs."""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.docs = []
+
+    def with_options(self, **kwargs):
+        return self
+
+    async def insert_many(self, docs, ordered):
+        if self.errors:
+            error = self.errors.pop(0)
+            raise error(docs) if callable(error) else error
+        self.docs.extend(docs)
+
+
+def turn(n=1):
+    user = {"id": f"u{n}", "session_id": "s", "role": "user", "content": "q", "timestamp": f"t{n}"}
+    assistant = {"id": f"a{n}", "session_id": "s", "role": "assistant", "content": "a", "timestamp": f"t{n}"}
+    return user, assistant
+
+
+def test_sync_failure_discards_turn():
+    collection = StubCollection(AutoReconnect("down"))
+    writer = server.ChatMessageWriter(collection, "sync", 200, 100)
+
+    async def run():
+        with pytest.raises(server.ChatWriteError):
+            await writer.write_turn(*turn())
+        # Nothing left for a later flush to save behind the client's retry
+        await writer.flush()
+
+    asyncio.run(run())
+    assert writer.buffered == 0
+    assert collection.docs == []
+
+
+def test_batched_retries_are_capped(monkeypatch):
+    monkeypatch.setattr(server, "CHAT_FLUSH_MAX_ATTEMPTS", 3)
+    collection = StubCollection(*[AutoReconnect("down")] * 5)
+    writer = server.ChatMessageWriter(collection, "batched", 200, 100)
+
+    async def run():
+        await writer.write_turn(*turn())
+        for _ in range(4):
+            await writer.flush()
+
+    asyncio.run(run())
+    assert writer.buffered == 0
+    assert {m["id"] for m in writer.dead_letters} == {"u1", "a1"}
+
+
+def test_rejected_documents_are_dead_lettered_not_retried():
+    def reject_second(docs):
+        return BulkWriteError({"writeErrors": [
+            {"index": 1, "code": 121, "errmsg": "Document failed validation"},
+        ]})
+
+    collection = StubCollection(reject_second)
+    writer = server.ChatMessageWriter(collection, "batched", 200, 100)
+
+    async def run():
+        await writer.write_turn(*turn())
+        await writer.flush()
+
+    asyncio.run(run())
+    assert writer.buffered == 0
+    assert [m["id"] for m in writer.dead_letters] == ["a1"]
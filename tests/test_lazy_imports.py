@@ -0,0 +1,23 @@
+"""Deferred imports: numpy is bound at import time but only loaded on first use."""
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+# A fresh interpreter, so nothing another test imported counts as loaded
+SCRIPT = """
+import server
+assert not server.module_loaded("numpy"), "numpy loaded at import"
+server.np.zeros(1)
+assert server.module_loaded("numpy"), "numpy still pending after use"
+assert server.module_loaded("json")
+"""
+
+
+def test_module_loaded_tracks_first_use():
+    env = {**os.environ, "MONGO_URL": os.environ.get("MONGO_URL", "mongodb://localhost:27017"),
+           "DB_NAME": os.environ.get("DB_NAME", "cl_test")}
+    result = subprocess.run([sys.executable, "-c", SCRIPT], cwd=BACKEND, env=env, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,84 @@
+"""Poll-mode live feed against a local mongod (MONGO_URL, default mongodb://localhost:27017).
+
+Skipped when no server answers. Runs in a throwaway database that is dropped afterwards.
+"""
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cl_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import pytest  # noqa: E402
+from pymongo import MongoClient  # noqa: E402
+from pymongo.errors import PyMongoError  # noqa: E402
+
+import server  # noqa: E402
+
+
+def mongod_available() -> bool:
+    try:
+        MongoClient(os.environ["MONGO_URL"], serverSelectionTimeoutMS=1000).admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+
+
+pytestmark = pytest.mark.skipif(not mongod_available(), reason="no local mongod")
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+async def wait_for_state(subscriber, app_id: str, **expected) -> dict:
+    """Merge the subscriber's changes for `app_id` until they show `expected`."""
+    seen = {}
+
+    async def drain():
+        while any(seen.get(k) != v for k, v in expected.items()):
+            for message in await subscriber.next_messages():
+                for change in message.get("changes", []):
+                    if change["id"] == app_id:
+                        seen.update(change)
+
+    await asyncio.wait_for(drain(), 5)
+    return seen
+
+
+async def exercise_poll_feed():
+    await server.db.applications.insert_one({
+        "id": "feed-1", "application_no": "FEED-1", "review_status": "Review Pending",
+        "is_overdue": False, "updated_at": now(),
+    })
+    feed = server.ApplicationFeed()
+    subscriber = feed.subscribe()
+    try:
+        # Let the watcher take its watermark before writing
+        await asyncio.sleep(0.3)
+        assert feed.mode == "poll"
+
+        await server.db.applications.update_one(
+            {"id": "feed-1"}, {"$set": {"review_status": "Approved", "updated_at": now()}}
+        )
+        seen = await wait_for_state(subscriber, "feed-1", review_status="Approved")
+        assert seen["application_no"] == "FEED-1"  # polling sends the row's summary fields
+
+        # Back-to-back writes may arrive merged or separately; the subscriber ends on the latest state
+        await server.db.applications.update_one({"id": "feed-1"}, {"$set": {"review_status": "Rejected", "updated_at": now()}})
+        await server.db.applications.update_one({"id": "feed-1"}, {"$set": {"is_overdue": True, "updated_at": now()}})
+        await wait_for_state(subscriber, "feed-1", review_status="Rejected", is_overdue=True)
+    finally:
+        feed.unsubscribe(subscriber)
+        await feed.stop()
+        await server.client.drop_database(os.environ["DB_NAME"])
+
+
+def test_poll_feed_publishes_changes(monkeypatch):
+    monkeypatch.setattr(server, "FEED_MODE", "poll")
+    monkeypatch.setattr(server, "FEED_POLL_SECONDS", 0.1)
+    monkeypatch.setattr(server, "FEED_FLUSH_SECONDS", 0.05)
+    asyncio.run(exercise_poll_feed())
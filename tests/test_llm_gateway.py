@@ -0,0 +1,113 @@
+"""Offline tests of the LLM gateway's retries, circuit breaker and timeouts.
+
+The gateway is driven with scripted and fake providers, so no network, Gemini key or
+MongoDB is needed (the Motor client connects lazily and is never used here).
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("MONGO_URL", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "cl_test")
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+import pytest  # noqa: E402
+
+import server  # noqa: E402
+
+MESSAGES = [{"role": "system", "content": "You are a test."}, {"role": "user", "content": "Hello"}]
+
+
+class ScriptedProvider:
+    """Fails with each scripted exception in turn, then answers."""
+
+    def __init__(self, *failures: Exception):
+        self.failures = list(failures)
+        self.calls = 0
+
+    async def complete(self, messages):
+        self.calls += 1
+        if self.failures:
+            raise self.failures.pop(0)
+        return "ok"
+
+    async def aclose(self):
+        pass
+
+
+def make_gateway(provider, max_retries=2, timeout=1.0, failure_threshold=3):
+    return server.LlmGateway(
+        lambda: provider,
+        max_concurrency=4,
+        timeout=timeout,
+        max_retries=max_retries,
+        breaker=server.CircuitBreaker(failure_threshold, reset_seconds=60),
+    )
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(server.LlmGateway, "_backoff", staticmethod(lambda attempt: 0))
+
+
+def retryable():
+    return server.LlmProviderError("Gemini returned 503", retryable=True)
+
+
+def test_retry_then_success():
+    provider = ScriptedProvider(retryable(), retryable())
+    gateway = make_gateway(provider)
+
+    assert asyncio.run(gateway.complete(MESSAGES)) == "ok"
+    assert provider.calls == 3
+    assert gateway.breaker.state == "closed"
+
+
+def test_retries_exhausted_opens_breaker():
+    provider = ScriptedProvider(retryable(), retryable(), retryable())
+    gateway = make_gateway(provider, max_retries=2, failure_threshold=3)
+
+    with pytest.raises(server.LlmError) as raised:
+        asyncio.run(gateway.complete(MESSAGES))
+    assert raised.value.status_code == 502
+    assert provider.calls == 3
+    assert gateway.breaker.state == "open"
+
+
+def test_open_breaker_fails_fast_without_calling_provider():
+    provider = ScriptedProvider()
+    gateway = make_gateway(provider, failure_threshold=1)
+    gateway.breaker.record_failure()
+
+    with pytest.raises(server.LlmUnavailableError) as raised:
+        asyncio.run(gateway.complete(MESSAGES))
+    assert raised.value.status_code == 503
+    assert provider.calls == 0
+
+
+def test_non_retryable_error_is_not_retried():
+    provider = ScriptedProvider(server.LlmProviderError("Gemini returned 400", retryable=False))
+    gateway = make_gateway(provider)
+
+    with pytest.raises(server.LlmProviderError):
+        asyncio.run(gateway.complete(MESSAGES))
+    assert provider.calls == 1
+    assert gateway.breaker.failures == 0
+
+
+def test_timeout():
+    gateway = make_gateway(server.FakeLlmProvider(latency_ms=500), max_retries=0, timeout=0.05)
+
+    with pytest.raises(server.LlmTimeoutError) as raised:
+        asyncio.run(gateway.complete(MESSAGES))
+    assert raised.value.status_code == 504
+
+
+def test_fake_provider_streams_answer():
+    gateway = make_gateway(server.FakeLlmProvider(latency_ms=10))
+
+    async def collect():
+        return "".join([chunk async for chunk in gateway.stream(MESSAGES)])
+
+    assert "Hello" in asyncio.run(collect())